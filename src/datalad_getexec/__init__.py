@@ -28,5 +28,23 @@ command_suite = (
             # optional name of the command in the Python API
             "getexec",
         ),
+        (
+            "datalad_getexec.worker",
+            "GetExecWorker",
+            "getexec-worker",
+            "getexec_worker",
+        ),
+        (
+            "datalad_getexec.materialize",
+            "GetExecMaterialize",
+            "getexec-materialize",
+            "getexec_materialize",
+        ),
+        (
+            "datalad_getexec.gc",
+            "GetExecGC",
+            "getexec-gc",
+            "getexec_gc",
+        ),
     ],
 )
@@ -1,3 +1,4 @@
+import os
 import sys
 
 
@@ -17,3 +18,12 @@ def removesuffix(s: str, suffix: str) -> str:
         if len(suffix) > 0 and s.endswith(suffix):
             return s[: -len(suffix)]
         return s
+
+
+def waitstatus_to_exitcode(status: int) -> int:
+    if sys.version_info >= (3, 9):  # pragma: py-lt-39
+        return os.waitstatus_to_exitcode(status)
+    else:  # pragma: py-gte-39
+        if os.WIFSIGNALED(status):
+            return -os.WTERMSIG(status)
+        return os.WEXITSTATUS(status)
@@ -0,0 +1,152 @@
+import functools
+import os
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Mapping, Optional
+
+_caller = threading.local()
+
+
+class _Caller:
+    def __init__(self, env: Optional[Dict[str, str]], cwd: str) -> None:
+        self.env = env
+        self.cwd = cwd
+        self.environ = os.environ if env is None else dict(os.environ, **env)
+
+
+@contextmanager
+def caller(env: Optional[Dict[str, str]], cwd: str) -> Iterator[None]:
+    """Look up configuration, in the current thread, like the process that
+    sent the variables ``env`` from ``cwd`` would, for executing its jobs.
+
+    Without variables, e.g. from a job submitted by an older version, ours
+    are used.
+    """
+    previous = getattr(_caller, "context", None)
+    _caller.context = _Caller(env, cwd)
+    try:
+        yield
+    finally:
+        _caller.context = previous
+
+
+def _context() -> Optional[_Caller]:
+    context: Optional[_Caller] = getattr(_caller, "context", None)
+    return context
+
+
+def environ() -> Mapping[str, str]:
+    """The environment to execute commands in: ours, with the variables of
+    the process we are acting for."""
+    context = _context()
+    return os.environ if context is None else context.environ
+
+
+def _env_name(name: str) -> str:
+    # datalad maps DATALAD_SOME_SECTION__OPT to datalad.some.section-opt
+    return "DATALAD_GETEXEC_" + name.upper().replace("-", "__")
+
+
+@functools.lru_cache(maxsize=None)
+def _git_config(cwd: str) -> Dict[str, str]:
+    # all of our items at once, read once per process, a lookup is done for
+    # nearly every setting of every execution
+    result = subprocess.run(
+        ["git", "config", "-z", "--get-regexp", r"^datalad\.getexec\."],
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    items = {}
+    # no match or no repository are no error, there is nothing configured
+    if result.returncode == 0:
+        for item in result.stdout.decode("utf-8").split("\0"):
+            if not item:
+                continue
+            key, newline, value = item.partition("\n")
+            # a key without a value means true to git, the last value wins
+            items[key[len("datalad.getexec.") :]] = value if newline else "true"
+    return items
+
+
+def get(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Look up the configuration item ``datalad.getexec.<name>``.
+
+    The environment takes precedence over git config, like it does in datalad.
+    This works without importing datalad, which keeps the special remote cheap
+    to start. Git config is read once per process, changes made to it later
+    are only seen by processes started afterwards.
+    """
+    context = _context()
+    if context is None or context.env is None:
+        value = os.environ.get(_env_name(name))
+    else:
+        value = context.env.get(_env_name(name))
+    if value is not None:
+        return value
+    return _git_config(os.getcwd() if context is None else context.cwd).get(
+        name, default
+    )
+
+
+def get_float(name: str, default: Optional[float] = None) -> Optional[float]:
+    value = get(name)
+    if value is None or value == "":
+        return default
+    return float(value)
+
+
+def get_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    value = get(name)
+    if value is None or value == "":
+        return default
+    return int(value)
+
+
+def get_bool(name: str, default: bool = False) -> bool:
+    value = get(name)
+    if value is None or value == "":
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def dataset_dir(cwd: Optional[str] = None) -> Path:
+    """Directory for getexec state of the dataset at ``cwd``, kept in its git
+    directory."""
+    return _git_dir(os.path.abspath(cwd or ".")) / "getexec"
+
+
+@functools.lru_cache(maxsize=None)
+def _git_dir(cwd: str) -> Path:
+    # failures raise and are not cached, a repository might still be created
+    git_dir = subprocess.run(
+        ["git", "rev-parse", "--absolute-git-dir"],
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True,
+        universal_newlines=True,
+    ).stdout.strip()
+    return Path(git_dir)
+
+
+def runtime_dir() -> Path:
+    """Directory for state shared between all getexec processes of the user.
+
+    It is local to the machine, so this is always looked up in our own
+    configuration, also when acting for another process.
+    """
+    configured = os.environ.get(_env_name("runtime-dir"))
+    if configured is None:
+        configured = _git_config(os.getcwd()).get("runtime-dir")
+    if configured is not None:
+        path = Path(configured)
+    elif "XDG_RUNTIME_DIR" in os.environ:
+        path = Path(os.environ["XDG_RUNTIME_DIR"]) / "datalad-getexec"
+    else:
+        path = Path(tempfile.gettempdir()) / "datalad-getexec-{}".format(os.getuid())
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return path
@@ -0,0 +1,268 @@
+"""Per-user daemon executing retrievals for all getexec special remotes
+
+git-annex starts a separate special remote process for every job, so with
+``-J16`` there are 16 of them, each paying for its own imports and none
+knowing what the others do. If ``datalad.getexec.daemon`` is enabled the
+special remotes instead delegate executions over a Unix socket to a single
+daemon per user, which is started on demand and stops itself after
+``datalad.getexec.daemon-idle-timeout`` seconds without requests.
+
+The daemon limits the number of concurrently running commands to
+``datalad.getexec.daemon-jobs``, not counting executions fetching their
+inputs, which may be computed by the daemon itself. It executes identical
+requests arriving while one is in flight only once, copying the output for
+the others.
+
+Requests and replies are single lines of JSON: a job like the ones in a
+spool, and a result like the ones written by getexec workers. Jobs carry the
+getexec configuration and the variables selecting software (e.g. ``PATH``)
+of the special remote's environment; configuration is looked up in them and
+in the repository of the job, and commands are executed with them, so that
+the daemon acts just like the special remote would.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import os
+import shutil
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from datalad_getexec import config, process
+from datalad_getexec.spool import Job
+
+logger = logging.getLogger("datalad.getexec.daemon")
+
+SOCKET_NAME = "daemon.sock"
+LOCK_NAME = "daemon.lock"
+
+
+class DaemonError(Exception):
+    pass
+
+
+@dataclass
+class _InFlight:
+    done: threading.Event = field(default_factory=threading.Event)
+    followers: List[str] = field(default_factory=list)
+    # by output filename of each follower
+    results: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: Daemon
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            return
+        job = Job.from_dict(json.loads(line))
+        result = self.server.execute(job)
+        self.wfile.write(json.dumps(result).encode("utf-8") + b"\n")
+
+
+class Daemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(
+        self, path: str, jobs: Optional[int] = None, idle_timeout: float = 300
+    ) -> None:
+        from datalad_getexec.execution import Executor
+
+        super().__init__(path, _Handler)
+        self.executor = Executor(
+            slots=threading.BoundedSemaphore(jobs or os.cpu_count() or 1)
+        )
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Tuple[str, str], _InFlight] = {}
+        self._active = 0
+        self._last_activity = time.monotonic()
+        self.executed = 0
+        self.deduplicated = 0
+        self.cpu_time = 0.0
+
+    def _execute(self, job: Job, in_flight: _InFlight) -> Dict[str, Any]:
+        from datalad_getexec.execution import execute_job
+
+        # whatever happens, followers must not be left waiting
+        result: Dict[str, Any] = {
+            "worker": "{}:{}".format(socket.gethostname(), os.getpid()),
+            "returncode": None,
+            "error": "daemon failed to execute the job",
+            "metrics": None,
+        }
+        try:
+            result = execute_job(self.executor, job)
+        finally:
+            with self._lock:
+                del self._in_flight[(job.url, job.key)]
+                followers = list(in_flight.followers)
+                self.executed += 1
+                if result["metrics"] is not None:
+                    self.cpu_time += result["metrics"]["cpu_time"]
+            in_flight.results = {follower: result for follower in followers}
+            try:
+                self._copy_to_followers(job, result, in_flight)
+            finally:
+                in_flight.done.set()
+        return result
+
+    def _copy_to_followers(
+        self, job: Job, result: Dict[str, Any], in_flight: _InFlight
+    ) -> None:
+        if result["error"] is not None or result["returncode"] != 0:
+            return
+        for follower in in_flight.results:
+            # the output has to be in place before anyone gets a reply,
+            # afterwards git-annex may move it away any time
+            try:
+                shutil.copyfile(job.filename, follower)
+            except OSError as e:
+                logger.warning("could not copy output to %s: %s", follower, e)
+                in_flight.results[follower] = dict(
+                    result, error="could not copy output: {}".format(e)
+                )
+
+    def execute(self, job: Job) -> Dict[str, Any]:
+        with self._lock:
+            self._active += 1
+            in_flight = self._in_flight.get((job.url, job.key))
+            leader = in_flight is None
+            if in_flight is None:
+                in_flight = self._in_flight[(job.url, job.key)] = _InFlight()
+            else:
+                in_flight.followers.append(job.filename)
+                self.deduplicated += 1
+        try:
+            if leader:
+                return self._execute(job, in_flight)
+            logger.debug("waiting for identical job in flight for %s", job.key)
+            in_flight.done.wait()
+            return dict(in_flight.results[job.filename], deduplicated=True)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._last_activity = time.monotonic()
+
+    def idle(self) -> bool:
+        with self._lock:
+            return (
+                self._active == 0
+                and time.monotonic() - self._last_activity > self.idle_timeout
+            )
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.executor.close()
+        logger.info(
+            "executed %d jobs using %.1fs cpu time, deduplicated %d",
+            self.executed,
+            self.cpu_time,
+            self.deduplicated,
+        )
+
+
+def _watch_idle(daemon: Daemon) -> None:
+    while not daemon.idle():
+        time.sleep(min(daemon.idle_timeout, 1.0))
+    logger.info("stopping idle daemon")
+    daemon.shutdown()
+
+
+def serve(runtime_dir: Path) -> None:
+    # only one daemon may serve a runtime directory; a daemon started
+    # concurrently by another special remote just leaves again
+    lock = open(runtime_dir / LOCK_NAME, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        logger.debug("daemon already running for %s", runtime_dir)
+        return
+    path = runtime_dir / SOCKET_NAME
+    path.unlink(missing_ok=True)
+    # preload what executions need, this is what makes the daemon warm
+    import datalad.api  # noqa: F401
+
+    daemon = Daemon(
+        str(path),
+        jobs=config.get_int("daemon-jobs"),
+        idle_timeout=config.get_float("daemon-idle-timeout") or 300.0,
+    )
+    process.install_signal_handlers()
+    watcher = threading.Thread(target=_watch_idle, args=(daemon,), daemon=True)
+    watcher.start()
+    try:
+        daemon.serve_forever()
+    finally:
+        daemon.server_close()
+        path.unlink(missing_ok=True)
+        lock.close()
+
+
+def _start(runtime_dir: Path) -> None:
+    logger.debug("starting daemon for %s", runtime_dir)
+    # the daemon serves all repositories, it must not stick to the one of the
+    # special remote that happened to start it
+    env = {k: v for k, v in os.environ.items() if k not in ("GIT_DIR", "GIT_WORK_TREE")}
+    subprocess.Popen(
+        [sys.executable, "-m", "datalad_getexec.daemon", str(runtime_dir)],
+        cwd=str(runtime_dir),
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def _connect(runtime_dir: Path, timeout: float) -> socket.socket:
+    path = str(runtime_dir / SOCKET_NAME)
+    start = time.monotonic()
+    last_start = None
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+            return sock
+        except (FileNotFoundError, ConnectionRefusedError):
+            sock.close()
+        # try again now and then, a daemon that was just shutting down might
+        # have kept the one we started from taking over
+        if last_start is None or time.monotonic() - last_start > 2:
+            _start(runtime_dir)
+            last_start = time.monotonic()
+        if time.monotonic() - start > timeout:
+            raise DaemonError("could not connect to daemon at {}".format(path))
+        time.sleep(0.05)
+
+
+def request(job: Job, runtime_dir: Path, timeout: float = 30) -> Dict[str, Any]:
+    """Have the daemon execute a job, starting the daemon if necessary."""
+    with _connect(runtime_dir, timeout) as sock:
+        sock.sendall(json.dumps(job.to_dict()).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as f:
+            reply = f.readline()
+    if not reply:
+        raise DaemonError("daemon closed the connection without reply")
+    result: Dict[str, Any] = json.loads(reply)
+    return result
+
+
+def main() -> None:
+    runtime_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else config.runtime_dir()
+    serve(runtime_dir)
+
+
+if __name__ == "__main__":
+    main()
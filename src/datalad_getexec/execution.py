@@ -0,0 +1,649 @@
+from __future__ import annotations
+
+import fnmatch
+import logging
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, replace
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+
+from datalad_getexec import (
+    compat,
+    config,
+    inputs,
+    metrics,
+    process,
+    resources,
+    staging,
+)
+from datalad_getexec.limits import Cgroup, Limits, Monitor, set_rlimits
+from datalad_getexec.spec import Spec
+from datalad_getexec.spool import Job
+from datalad_getexec.transient import TransientInputs
+
+if TYPE_CHECKING:
+    from datalad_getexec.pool import PythonWorkerPool
+    from datalad_getexec.server import ServerPool
+
+logger = logging.getLogger("datalad.getexec.execution")
+
+IONICE_CLASSES = {"realtime": "1", "best-effort": "2", "idle": "3"}
+
+
+class ExecutionError(Exception):
+    pass
+
+
+@dataclass
+class ExecutionResult:
+    returncode: int
+    duration: float
+    cpu_time: float
+    max_rss: int
+    # which limit, if any, the execution was stopped for
+    limit_exceeded: Optional[str] = None
+    # returncode, duration and resource usage of each stage of a pipeline
+    stages: Optional[List[Dict[str, Any]]] = None
+    # the last bytes the command wrote to stderr
+    stderr_tail: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, dict: Dict[str, Any]) -> ExecutionResult:
+        return cls(**dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def drop_inputs(paths: List[str], cwd: Optional[str] = None) -> None:
+    import datalad.api as da
+
+    logger.info("dropping transient inputs: %s", paths)
+    # relative to cwd, which need not be our working directory
+    base = os.path.abspath(cwd or "")
+    for root, group in inputs.by_dataset(paths, cwd).items():
+        for result in da.drop(
+            [os.path.join(base, path) for path in group],
+            dataset=os.path.join(base, root),
+            on_failure="ignore",
+            result_renderer="disabled",
+            return_type="generator",
+        ):
+            if result["status"] not in ("ok", "notneeded"):
+                logger.warning(
+                    "could not drop %s: %s", result["path"], result.get("message")
+                )
+
+
+def resource_needs(spec: Spec) -> Dict[str, int]:
+    needs = {"cpus": spec.cpus if spec.cpus is not None else 1}
+    if spec.memory is not None:
+        needs["memory"] = spec.memory
+    needs.update(spec.resources or {})
+    return needs
+
+
+def with_ionice(cmd: List[str], ionice: Optional[str]) -> List[str]:
+    if ionice is None:
+        return cmd
+    if ionice not in IONICE_CLASSES:
+        raise ExecutionError("unknown ionice class {}".format(ionice))
+    if shutil.which("ionice") is None:
+        logger.debug("ionice is not available, ignoring class %s", ionice)
+        return cmd
+    return ["ionice", "-c", IONICE_CLASSES[ionice]] + cmd
+
+
+def command_env(spec: Spec) -> Optional[Dict[str, str]]:
+    """The environment to execute a spec in, None to inherit ours.
+
+    Executing on behalf of another process, its environment is the one to
+    start from.
+    """
+    base = config.environ()
+    if spec.env is None and spec.env_allow is None:
+        return None if base is os.environ else dict(base)
+    if spec.env_allow is None:
+        env = dict(base)
+    else:
+        allow = spec.env_allow
+        env = {
+            name: value
+            for name, value in base.items()
+            if any(fnmatch.fnmatchcase(name, pattern) for pattern in allow)
+        }
+    env.update(spec.env or {})
+    return env
+
+
+def checkpoint_dir(spec: Spec, cwd: Optional[str] = None) -> Path:
+    """The directory a checkpointed command saves its progress in.
+
+    It is kept when an execution fails and removed once one succeeds, so a
+    command finding something in it is resuming an earlier attempt.
+    """
+    return config.dataset_dir(cwd) / "checkpoints" / staging.recipe_id(spec)
+
+
+def _with_env(spec: Spec, **variables: str) -> Spec:
+    env = dict(spec.env or {})
+    env.update(variables)
+    return replace(spec, env=env)
+
+
+def with_checkpoint(spec: Spec, directory: Path) -> Spec:
+    """The spec with the checkpoint directory and whether this is a resume
+    passed in its environment."""
+    resume = directory.is_dir() and any(directory.iterdir())
+    directory.mkdir(parents=True, exist_ok=True)
+    if resume:
+        logger.info("resuming from checkpoint %s", directory)
+    return _with_env(
+        spec,
+        GETEXEC_CHECKPOINT_DIR=str(directory),
+        GETEXEC_RESUME="1" if resume else "0",
+    )
+
+
+@contextmanager
+def scratch_space(output: str) -> Iterator[Tuple[str, Optional[str]]]:
+    """Where to have a command write ``output``, and its temporary files.
+
+    With ``datalad.getexec.scratch-dir`` configured, e.g. to node-local
+    storage, both are in a directory created below it for one execution and
+    removed afterwards. Otherwise the command writes the output in place and
+    its temporary files wherever it does by default.
+    """
+    root = config.get("scratch-dir")
+    if not root:
+        yield output, None
+        return
+    os.makedirs(root, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix="getexec-", dir=root)
+    process.register_output(directory)
+    try:
+        target = os.path.join(directory, "output")
+        if os.path.isdir(output):
+            # a multi-output recipe, which gets a directory to write to
+            os.mkdir(target)
+        tmp = os.path.join(directory, "tmp")
+        os.mkdir(tmp)
+        yield target, tmp
+    finally:
+        process.unregister_output(directory)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _move_output(source: str, output: str) -> None:
+    # from another file system this is a copy, in a single sequential pass
+    if os.path.isdir(output):
+        os.rmdir(output)
+    shutil.move(source, output)
+
+
+class _StderrTee(threading.Thread):
+    """Passes what a command writes to stderr on to ours, keeping the tail."""
+
+    def __init__(self, fd: int, size: int = 4096) -> None:
+        super().__init__(daemon=True)
+        self.fd = fd
+        self.size = size
+        self.tail = b""
+
+    def run(self) -> None:
+        while True:
+            chunk = os.read(self.fd, 65536)
+            if not chunk:
+                return
+            try:
+                os.write(2, chunk)
+            except OSError:
+                pass
+            self.tail = (self.tail + chunk)[-self.size :]
+
+
+def run_cmd(
+    cmd: List[str],
+    cwd: Optional[str] = None,
+    nice: Optional[int] = None,
+    limits: Optional[Limits] = None,
+    output: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> ExecutionResult:
+    """Execute a command, writing its stdout to ``output`` if given.
+
+    The output file becomes the stdout of the command itself, so its output
+    goes to disk without passing through this process.
+    """
+    return run_pipeline([cmd], cwd, nice, limits, output, env, cancel)
+
+
+def run_pipeline(
+    stages: List[List[str]],
+    cwd: Optional[str] = None,
+    nice: Optional[int] = None,
+    limits: Optional[Limits] = None,
+    output: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> ExecutionResult:
+    """Execute commands with the stdout of each connected to the stdin of the
+    next, like a shell pipeline with pipefail set.
+
+    All stages share a process group, the limits apply to all of them
+    together. The returncode is the one of the last stage that failed.
+    Setting ``cancel`` terminates all stages.
+    """
+    logger.debug("executing %s", stages)
+    limits = limits or Limits()
+    cgroup = Cgroup.create(limits.memory) if limits.memory is not None else None
+    pgid = 0
+
+    def preexec() -> None:
+        # the first stage starts a new process group, the others join it
+        os.setpgid(0, pgid)
+        if nice is not None:
+            os.nice(nice)
+        set_rlimits(limits)
+        if cgroup is not None:
+            cgroup.join()
+
+    grace = config.get_float("kill-grace") or 5.0
+    start = time.monotonic()
+    if output is not None:
+        target: Any = open(os.path.join(cwd or "", output), "wb")
+    else:
+        target = subprocess.PIPE
+    # stderr of all stages goes through a pipe of ours, to remember its tail
+    stderr_read, stderr_write = os.pipe()
+    procs: List[subprocess.Popen] = []
+    try:
+        for i, cmd in enumerate(stages):
+            proc = subprocess.Popen(
+                cmd,
+                # the special remote's stdin is the channel from git-annex,
+                # which is not for the command to read from
+                stdin=procs[-1].stdout if procs else subprocess.DEVNULL,
+                stdout=target if i == len(stages) - 1 else subprocess.PIPE,
+                stderr=stderr_write,
+                cwd=cwd,
+                env=env,
+                preexec_fn=preexec,
+            )
+            if procs:
+                # only the next stage may hold the read end, so that the
+                # previous one gets SIGPIPE if it exits early
+                assert procs[-1].stdout is not None
+                procs[-1].stdout.close()
+            else:
+                pgid = proc.pid
+                process.register_group(pgid)
+            procs.append(proc)
+    except BaseException:
+        if pgid:
+            process.terminate_group(pgid, grace)
+            process.unregister_group(pgid)
+        os.close(stderr_read)
+        raise
+    finally:
+        os.close(stderr_write)
+        if output is not None:
+            target.close()
+    stderr = _StderrTee(stderr_read)
+    stderr.start()
+    monitor = Monitor(procs[0], limits, grace=grace, cancel=cancel)
+    if limits.timeout is not None or limits.memory is not None or cancel is not None:
+        monitor.start()
+    stdout: List[bytes] = []
+    pipe = procs[-1].stdout
+    reader = None
+    if pipe is not None:
+        # read in a thread, processes left behind by the command could keep
+        # the pipe open after it has exited
+        reader = threading.Thread(
+            target=lambda: stdout.append(pipe.read()), daemon=True
+        )
+        reader.start()
+    finished: Dict[int, Tuple[int, float, Any]] = {}
+    try:
+        while len(finished) < len(procs):
+            # wait4 gives us the resource usage of exactly these children,
+            # which the process-wide RUSAGE_CHILDREN would not with concurrent
+            # executions
+            pid, status, rusage = os.wait4(-pgid, 0)
+            finished[pid] = (status, time.monotonic() - start, rusage)
+    finally:
+        monitor.stop()
+        # whatever is left in the process group is of no use anymore
+        process.terminate_group(pgid, grace)
+        process.unregister_group(pgid)
+    if reader is not None and pipe is not None:
+        reader.join(grace)
+        if not reader.is_alive():
+            pipe.close()
+        logger.info(b"".join(stdout))
+    stderr.join(grace)
+    if not stderr.is_alive():
+        os.close(stderr_read)
+    duration = time.monotonic() - start
+    stage_results = []
+    for proc in procs:
+        status, stage_duration, rusage = finished[proc.pid]
+        proc.returncode = compat.waitstatus_to_exitcode(status)
+        stage_results.append(
+            {
+                "cmd": proc.args,
+                "returncode": proc.returncode,
+                "duration": stage_duration,
+                "cpu_time": rusage.ru_utime + rusage.ru_stime,
+                "max_rss": rusage.ru_maxrss,
+            }
+        )
+    failed = [stage for stage in stage_results if stage["returncode"] != 0]
+    exceeded = monitor.exceeded
+    if any(stage["returncode"] == -signal.SIGXCPU for stage in stage_results):
+        exceeded = "cpu_time"
+    if cgroup is not None:
+        if cgroup.oom_killed():
+            exceeded = "memory"
+        cgroup.remove()
+    return ExecutionResult(
+        returncode=failed[-1]["returncode"] if failed else 0,
+        duration=duration,
+        cpu_time=sum(stage["cpu_time"] for stage in stage_results),
+        max_rss=max(stage["max_rss"] for stage in stage_results),
+        limit_exceeded=exceeded,
+        stages=stage_results if len(stages) > 1 else None,
+        stderr_tail=stderr.tail.decode("utf-8", "replace") or None,
+    )
+
+
+def _metrics_store(cwd: Optional[str]) -> Optional[metrics.MetricsStore]:
+    try:
+        return metrics.MetricsStore.for_dataset(cwd)
+    except (OSError, subprocess.CalledProcessError) as e:
+        # not executing in a dataset, nowhere to record metrics
+        logger.debug("not recording metrics: %s", e)
+        return None
+
+
+class Executor:
+    """Executes specs, fetching their inputs first.
+
+    An executor is owned by whatever process ends up running commands: the
+    special remote itself or a getexec worker. Python callable specs are run
+    in pools of warm worker processes, one per working directory, and server
+    commands are kept running, both for as long as the executor lives.
+    """
+
+    def __init__(self, slots: Optional[threading.Semaphore] = None) -> None:
+        # limits concurrent commands, not fetching their inputs, which might
+        # need executions of their own
+        self._slots = slots
+        # the daemon runs jobs in concurrent threads, which must not start
+        # pools of their own
+        self._pools_lock = threading.Lock()
+        self._python_pools: Dict[str, PythonWorkerPool] = {}
+        self._server_pool: Optional[ServerPool] = None
+
+    def _get_python_pool(self, name: str, cwd: str) -> PythonWorkerPool:
+        with self._pools_lock:
+            if cwd not in self._python_pools:
+                from datalad_getexec.pool import PythonWorkerPool
+
+                preload = (config.get("python-preload") or "").replace(",", " ").split()
+                # also preload the module of the first callable, later ones
+                # are most likely from the same recipe collection
+                preload.append(name.partition(":")[0])
+                self._python_pools[cwd] = PythonWorkerPool(
+                    preload, cwd, max_workers=config.get_int("python-workers")
+                )
+            return self._python_pools[cwd]
+
+    def _get_server_pool(self) -> ServerPool:
+        with self._pools_lock:
+            if self._server_pool is None:
+                from datalad_getexec.server import ServerPool
+
+                self._server_pool = ServerPool(
+                    max_jobs=config.get_int("server-max-jobs"),
+                    idle_timeout=config.get_float("server-idle-timeout", 60.0),
+                )
+            return self._server_pool
+
+    def run(
+        self,
+        spec: Spec,
+        filename: str,
+        cwd: Optional[str] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> ExecutionResult:
+        """Execute a spec for ``filename``.
+
+        Setting ``cancel`` terminates the command; servers and python
+        functions are not interrupted.
+        """
+        if spec.output is not None:
+            return self._run_staged(spec, filename, cwd, cancel)
+        return self._execute(spec, filename, cwd, cancel)
+
+    def _run_staged(
+        self,
+        spec: Spec,
+        filename: str,
+        cwd: Optional[str],
+        cancel: Optional[threading.Event],
+    ) -> ExecutionResult:
+        assert spec.output is not None
+        if spec.stdout:
+            raise ExecutionError("a command with several outputs can not use stdout")
+        target = os.path.join(cwd or "", filename)
+        directory = staging.staging_dir(cwd)
+        ttl = config.get_float("staged-ttl", 86400.0)
+        if ttl:
+            staging.expire(directory, ttl)
+        with staging.locked(directory, staging.stage_id(spec, cwd)) as staged:
+            if staging.take(staged, spec.output, target):
+                logger.info("took staged output %s", spec.output)
+                return ExecutionResult(
+                    returncode=0, duration=0.0, cpu_time=0.0, max_rss=0
+                )
+            # only we can be using this name while holding the lock
+            tmp = staged.with_name(staged.name + ".tmp")
+            shutil.rmtree(tmp, ignore_errors=True)
+            tmp.mkdir()
+            result = self._execute(spec, str(tmp), cwd, cancel)
+            if result.returncode != 0:
+                return result
+            shutil.rmtree(staged, ignore_errors=True)
+            tmp.rename(staged)
+            # staged outputs expire counting from now
+            os.utime(staged)
+            if not staging.take(staged, spec.output, target):
+                raise ExecutionError(
+                    "{} was not written by the command".format(spec.output)
+                )
+        return result
+
+    def _execute(
+        self,
+        spec: Spec,
+        filename: str,
+        cwd: Optional[str],
+        cancel: Optional[threading.Event],
+    ) -> ExecutionResult:
+        store = _metrics_store(cwd)
+        try:
+            paths = inputs.resolve(spec, cwd)
+        except subprocess.CalledProcessError as e:
+            raise ExecutionError(
+                "could not expand input globs {}: {}".format(spec.input_globs, e)
+            ) from e
+        missing = metrics.missing_inputs(paths, cwd)
+        transient = []
+        # also with nothing missing: inputs fetched by a concurrent execution
+        # must not be dropped while this one needs them
+        if paths and config.get_bool("transient-inputs"):
+            transient = TransientInputs.for_dataset(cwd).acquire(paths, missing)
+        try:
+            if paths:
+                start = time.monotonic()
+                inputs.fetch(paths, cwd)
+                if store is not None:
+                    store.record_fetch(missing, time.monotonic() - start)
+            return self._execute_fetched(spec, filename, cwd, cancel, store)
+        finally:
+            if transient:
+                TransientInputs.for_dataset(cwd).release(
+                    transient, partial(drop_inputs, cwd=cwd)
+                )
+
+    def _execute_fetched(
+        self,
+        spec: Spec,
+        filename: str,
+        cwd: Optional[str],
+        cancel: Optional[threading.Event],
+        store: Optional[metrics.MetricsStore],
+    ) -> ExecutionResult:
+        # only take resources after the inputs are there, getting them might
+        # involve executions needing resources themselves
+        needs = resource_needs(spec)
+        pool = resources.ResourcePool(config.runtime_dir())
+        output = os.path.join(cwd or "", filename)
+        checkpoint = checkpoint_dir(spec, cwd) if spec.checkpoint else None
+        run_spec = spec if checkpoint is None else with_checkpoint(spec, checkpoint)
+        process.register_output(output)
+        try:
+            with scratch_space(output) as (target, tmp):
+                # servers and python workers are shared between executions,
+                # their environment is not ours to set
+                if tmp is not None and not (spec.server or spec.python is not None):
+                    run_spec = _with_env(run_spec, TMPDIR=tmp)
+                with pool.acquire(
+                    needs, resources.capacities(needs), cancel=cancel
+                ), self._slots or nullcontext():
+                    result = self._run(
+                        run_spec, filename if tmp is None else target, cwd, cancel
+                    )
+                if tmp is not None and result.returncode == 0:
+                    if os.path.lexists(target):
+                        _move_output(target, output)
+        except resources.AcquireCancelled as e:
+            process.remove_output(output)
+            raise ExecutionError(str(e)) from e
+        except BaseException:
+            process.remove_output(output)
+            raise
+        finally:
+            process.unregister_output(output)
+        if result.returncode != 0:
+            # do not leave partial outputs behind
+            process.remove_output(output)
+            return result
+        if result.limit_exceeded is None:
+            if checkpoint is not None:
+                shutil.rmtree(checkpoint, ignore_errors=True)
+            if store is not None:
+                store.record_run(spec.fingerprint(), result.duration)
+        return result
+
+    def _run(
+        self,
+        spec: Spec,
+        filename: str,
+        cwd: Optional[str],
+        cancel: Optional[threading.Event],
+    ) -> ExecutionResult:
+        args = spec.args or []
+        if spec.stdout and (spec.server or spec.python is not None):
+            raise ExecutionError(
+                "only commands can write their output to stdout, "
+                "not servers or python functions"
+            )
+        if spec.pipeline and (spec.server or spec.python is not None):
+            raise ExecutionError(
+                "only commands can be part of a pipeline, "
+                "not servers or python functions"
+            )
+        if spec.checkpoint and (spec.server or spec.python is not None):
+            raise ExecutionError(
+                "only commands can be checkpointed, not servers or python functions"
+            )
+        limits = Limits(spec.timeout, spec.cpu_limit, spec.memory_limit)
+        if limits != Limits() and (spec.server or spec.python is not None):
+            raise ExecutionError(
+                "limits can only be enforced for commands, "
+                "not servers or python functions"
+            )
+        if spec.cwd is not None:
+            # the output path is relative to where we were called from
+            filename = os.path.abspath(os.path.join(cwd or "", filename))
+            cwd = os.path.join(cwd or "", spec.cwd)
+        env = command_env(spec)
+        if spec.server:
+            return self._get_server_pool().request(spec.cmd, args, filename, cwd, env)
+        if spec.python is not None:
+            if spec.env is not None or spec.env_allow is not None:
+                raise ExecutionError(
+                    "python functions share their workers' environment, "
+                    "it can not be set for them"
+                )
+            return self._get_python_pool(spec.python, os.path.abspath(cwd or ".")).run(
+                spec.python, spec.cmd + args + [filename]
+            )
+        return run_pipeline(
+            [
+                with_ionice(stage, spec.ionice)
+                for stage in (spec.pipeline or []) + [spec.command(filename)]
+            ],
+            cwd,
+            spec.nice,
+            limits,
+            output=filename if spec.stdout else None,
+            env=env,
+            cancel=cancel,
+        )
+
+    def close(self) -> None:
+        with self._pools_lock:
+            for python_pool in self._python_pools.values():
+                python_pool.close()
+            self._python_pools.clear()
+            if self._server_pool is not None:
+                self._server_pool.close()
+                self._server_pool = None
+
+
+def execute_job(executor: Executor, job: Job) -> Dict[str, Any]:
+    """Execute a job on behalf of another process.
+
+    Returns a result suitable for sending back to the special remote that
+    submitted the job.
+    """
+    result: Dict[str, Any] = {
+        "worker": "{}:{}".format(socket.gethostname(), os.getpid()),
+        "returncode": None,
+        "error": None,
+        "metrics": None,
+    }
+    try:
+        spec = Spec.from_url(job.url)
+        with config.caller(job.env, job.cwd):
+            execution = executor.run(spec, job.filename, job.cwd)
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+    result["returncode"] = execution.returncode
+    result["metrics"] = execution.to_dict()
+    return result
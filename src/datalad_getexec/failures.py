@@ -0,0 +1,62 @@
+"""Negative cache of failed executions
+
+A failed execution is recorded with its exit status and the tail of what the
+command wrote to stderr, keyed by the spec's fingerprint and the state of its
+inputs in the index. Retrieving a key with the same recipe then fails right
+away, without fetching inputs and executing the command again, until the
+recipe or its inputs change or ``datalad.getexec.failure-ttl`` seconds have
+passed. Setting ``datalad.getexec.force`` retries regardless.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from datalad_getexec import config, inputs
+from datalad_getexec.spec import Spec
+from datalad_getexec.utils import load_json, locked_json
+
+logger = logging.getLogger("datalad.getexec.failures")
+
+
+def failure_id(spec: Spec, cwd: Optional[str] = None) -> str:
+    return hashlib.sha256(
+        "{}\0{}".format(spec.fingerprint(), inputs.state(spec, cwd)).encode("utf-8")
+    ).hexdigest()
+
+
+class FailureCache:
+    def __init__(self, directory: Path) -> None:
+        self._path = directory / "failures.json"
+
+    @classmethod
+    def for_dataset(cls, cwd: Optional[str] = None) -> FailureCache:
+        return cls(config.dataset_dir(cwd))
+
+    def get(self, id: str, ttl: float) -> Optional[Dict[str, Any]]:
+        """The recorded failure, None if there is none younger than ttl."""
+        failure: Optional[Dict[str, Any]] = load_json(self._path).get(id)
+        if failure is None or time.time() - failure["time"] > ttl:
+            return None
+        return failure
+
+    def record(
+        self, id: str, returncode: Optional[int], reason: str, stderr_tail: str
+    ) -> None:
+        with locked_json(self._path) as failures:
+            failures[id] = {
+                "time": time.time(),
+                "returncode": returncode,
+                "reason": reason,
+                "stderr_tail": stderr_tail,
+            }
+
+    def forget(self, id: str) -> None:
+        if id not in load_json(self._path):
+            return
+        with locked_json(self._path) as failures:
+            failures.pop(id, None)
@@ -0,0 +1,266 @@
+"""DataLad getexec-gc command"""
+
+__docformat__ = "restructuredtext"
+
+import logging
+import os
+import re
+import shutil
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from datalad.distribution.dataset import (
+    Dataset,
+    EnsureDataset,
+    datasetmethod,
+    require_dataset,
+    resolve_path,
+)
+from datalad.interface.base import Interface, build_doc, eval_results
+from datalad.interface.results import get_status_dict
+from datalad.support.constraints import EnsureNone, EnsureStr
+from datalad.support.param import Parameter
+
+from datalad_getexec import config, keys, metrics, staging
+from datalad_getexec.preflight import Preflight
+from datalad_getexec.spec import Spec
+
+logger = logging.getLogger("datalad.getexec.gc")
+
+_SIZE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*$", re.IGNORECASE)
+
+
+@build_doc
+class GetExecGC(Interface):
+    """Drop content that getexec can compute again, to free disk space
+
+    Only files registered with getexec whose content is present are
+    considered, and only those with a command that can be executed here,
+    as far as can be told without executing it: its executables are found
+    and a copy of each of its inputs is known. Of these, files are dropped
+    until the getexec content present in the dataset is at most --max-size,
+    or the file system of the annex has at least --free space left.
+
+    Files which are cheap to compute again relative to the space they take,
+    and which have not been accessed for long, are dropped first: the
+    estimated cost of a file, from the runtimes recorded for its command and
+    the time it takes to fetch the command's missing inputs, is divided by
+    its size and by one plus the days since it was last accessed. Files
+    whose command never ran here are dropped last. Outputs staged for
+    retrieval by commands with several outputs count towards the getexec
+    content as well, and are removed before any file is dropped.
+
+    Sizes are given in bytes, or with a suffix K, M, G or T for powers of
+    1024.
+    """
+
+    _examples_ = [
+        dict(
+            text="Drop computed files until at least 100 GiB are free",
+            code_py='getexec_gc(free="100G")',
+            code_cmd="datalad getexec-gc --free 100G",
+        ),
+        dict(
+            text="Keep at most 10 GiB of computed files of a directory",
+            code_py='getexec_gc("derived", max_size="10G")',
+            code_cmd="datalad getexec-gc --max-size 10G derived",
+        ),
+    ]
+
+    _params_ = dict(
+        path=Parameter(
+            args=("path",),
+            metavar="PATH",
+            nargs="*",
+            doc="""files or directories to drop computed files from. Defaults
+            to the whole dataset.""",
+            constraints=EnsureStr() | EnsureNone(),
+        ),
+        dataset=Parameter(
+            args=("-d", "--dataset"),
+            metavar="PATH",
+            doc="""specify the dataset to drop files in. If no dataset is
+            given, an attempt is made to identify the dataset based on the
+            current working directory.""",
+            constraints=EnsureDataset() | EnsureNone(),
+        ),
+        max_size=Parameter(
+            args=("--max-size",),
+            metavar="SIZE",
+            doc="""drop computed files until those present take at most this
+            much space.""",
+            constraints=EnsureStr() | EnsureNone(),
+        ),
+        free=Parameter(
+            args=("--free",),
+            metavar="SIZE",
+            doc="""drop computed files until this much space is free on the
+            file system of the annex.""",
+            constraints=EnsureStr() | EnsureNone(),
+        ),
+    )
+
+    @staticmethod
+    @datasetmethod(name="getexec_gc")
+    @eval_results
+    def __call__(
+        path: Optional[List[str]] = None,
+        dataset: Optional[Dataset] = None,
+        max_size: Optional[str] = None,
+        free: Optional[str] = None,
+    ) -> Iterable[Dict]:
+        ds = require_dataset(dataset, check_installed=True, purpose="drop files")
+        if max_size is None and free is None:
+            yield get_status_dict(
+                action="getexec-gc",
+                status="impossible",
+                message="give a target with --max-size or --free",
+            )
+            return
+        try:
+            max_bytes = parse_size(max_size) if max_size is not None else None
+            free_bytes = parse_size(free) if free is not None else None
+        except ValueError as e:
+            yield get_status_dict(
+                action="getexec-gc", status="impossible", message=str(e)
+            )
+            return
+        candidates = _candidates(ds, path, dataset)
+        staged = staging.staging_dir(ds.path)
+        needed = 0
+        if max_bytes is not None:
+            needed = sum(c.size for c in candidates) + staging.size(staged) - max_bytes
+        if free_bytes is not None:
+            available = shutil.disk_usage(ds.repo.dot_git).free
+            needed = max(needed, free_bytes - available)
+        if needed <= 0:
+            yield get_status_dict(
+                action="getexec-gc",
+                path=ds.path,
+                status="notneeded",
+                message="target already met",
+            )
+            return
+        # staged outputs are of no use until retrieved, and cost nothing to
+        # check for whether they can be computed again
+        freed = staging.expire(staged, 0)
+        if freed:
+            yield get_status_dict(
+                action="getexec-gc",
+                path=str(staged),
+                status="ok",
+                message=("removed %d bytes of staged outputs", freed),
+            )
+        selected = select(
+            rank([c for c in candidates if c.recomputable]), needed - freed
+        )
+        for i in range(0, len(selected), 100):
+            chunk = {c.path: c for c in selected[i : i + 100]}
+            for result in ds.drop(
+                list(chunk),
+                return_type="generator",
+                on_failure="ignore",
+                result_renderer="disabled",
+            ):
+                if result.get("status") == "ok" and result.get("path") in chunk:
+                    freed += chunk[result["path"]].size
+                yield result
+        yield get_status_dict(
+            action="getexec-gc",
+            path=ds.path,
+            status="ok" if freed >= needed else "impossible",
+            message=(
+                "freed %d of %d bytes by dropping computed files",
+                freed,
+                needed,
+            ),
+        )
+
+
+@dataclass
+class Candidate:
+    path: str
+    size: int
+    # estimated seconds to compute again, None if never executed here
+    cost: Optional[float]
+    atime: float
+    recomputable: bool
+
+
+def parse_size(size: str) -> int:
+    match = _SIZE.match(size)
+    if match is None:
+        raise ValueError("invalid size {}".format(size))
+    factor = 1024 ** " KMGT".index(match.group(2).upper() or " ")
+    return int(float(match.group(1)) * factor)
+
+
+def rank(candidates: List[Candidate], now: Optional[float] = None) -> List[Candidate]:
+    """Order candidates by which to drop first."""
+    now = time.time() if now is None else now
+
+    def score(c: Candidate) -> float:
+        age = max(now - c.atime, 0) / 86400
+        return (c.cost or 0) / max(c.size, 1) / (1 + age)
+
+    return sorted(candidates, key=lambda c: (c.cost is None, score(c), c.atime))
+
+
+def select(ranked: List[Candidate], needed: int) -> List[Candidate]:
+    """The first of the ranked candidates freeing the space needed."""
+    selected = []
+    freed = 0
+    for candidate in ranked:
+        if freed >= needed:
+            break
+        selected.append(candidate)
+        freed += candidate.size
+    return selected
+
+
+def _candidates(
+    ds: Dataset, path: Optional[List[str]], dataset: Optional[Dataset]
+) -> List[Candidate]:
+    preflight = Preflight(ds.path, executables=config.get("spool-dir") is None)
+    recorded = metrics.MetricsStore.for_dataset(ds.path).load()
+    candidates = []
+    for record in ds.repo.call_annex_records(
+        ["whereis", "--in=here"],
+        files=[str(resolve_path(p, dataset)) for p in path or [ds.path]],
+    ):
+        urls = [
+            url
+            for remote in record.get("whereis", [])
+            for url in remote.get("urls", [])
+            if url.startswith("getexec:")
+        ]
+        if not urls:
+            continue
+        costs: List[Optional[float]] = []
+        for url in urls:
+            try:
+                spec = Spec.from_url(url)
+            except ValueError:
+                continue
+            if preflight.check(spec) is None:
+                costs.append(metrics.estimate(spec, recorded, ds.path)[0])
+        file = str(ds.pathobj / record["file"])
+        stat = os.stat(file)
+        size = keys.Key.parse(record["key"]).size
+        known = [cost for cost in costs if cost is not None]
+        candidates.append(
+            Candidate(
+                path=file,
+                size=size if size is not None else stat.st_size,
+                cost=min(known) if known else None,
+                atime=stat.st_atime,
+                recomputable=bool(costs),
+            )
+        )
+    logger.info(
+        "%d files with computed content present, %d of them recomputable",
+        len(candidates),
+        sum(c.recomputable for c in candidates),
+    )
+    return candidates
@@ -2,9 +2,14 @@
 
 __docformat__ = "restructuredtext"
 
+import dataclasses
+import itertools
 import json
 import logging
-from typing import Dict, Iterable, List, Literal, Optional
+import os
+import subprocess
+from pathlib import PurePosixPath
+from typing import Dict, Iterable, Iterator, List, Literal, Optional, Tuple
 
 from datalad.distribution.dataset import (
     Dataset,
@@ -15,7 +20,12 @@ from datalad.distribution.dataset import (
 from datalad.interface.base import Interface, build_doc, eval_results
 from datalad.interface.results import get_status_dict
 from datalad.support.annexrepo import AnnexRepo
-from datalad.support.constraints import EnsureNone, EnsureStr
+from datalad.support.constraints import (
+    EnsureChoice,
+    EnsureInt,
+    EnsureNone,
+    EnsureStr,
+)
 from datalad.support.param import Parameter
 
 import datalad_getexec.remote
@@ -33,7 +43,88 @@ class GetExec(Interface):
     that you need to execute a shell yourself. In the invocation a last
     argument naming the output file the command should write to is added.
     Therefore your command should expect a single argument which specifies it's
-    output path.
+    output path. With the --stdout option no argument is added, instead
+    everything the command writes to stdout becomes the content of the file.
+    This makes wrapping tools which print their result in a shell
+    unnecessary.
+
+    With the --pipeline option, arguments consisting of a single "|" separate
+    the command into stages, which are executed like a shell pipeline with
+    pipefail set, but without a shell: the stdout of each stage is connected
+    to the stdin of the next one, and the execution fails if any of the stages
+    fails. Only the last stage gets the output path, or writes its stdout to
+    the file with --stdout.
+
+    Alternatively, a python function can be registered with the --python
+    option. It is called with the given arguments and the output path in a
+    pool of worker processes which are kept alive by the special remote for
+    all retrievals it handles. This avoids the startup cost of a new
+    interpreter and of its imports for every single file.
+
+    Commands with an expensive startup, e.g. R, MATLAB or JVM based tools, can
+    be registered as servers with the --server option. Such a command is
+    started once and kept running by the special remote. For every file it
+    receives a line on stdin with the arguments given with --arg and the
+    output path, separated by tabs. It has to reply with a line "DONE" on
+    stdout once it has written the file, or "ERROR" followed by a message.
+
+    All executions on a machine share a pool of CPUs, memory and custom
+    resources. An execution only starts once the resources declared for it
+    are available, by default it takes a single CPU. The capacity of the
+    pool is configured with "datalad.getexec.cpus" (default: all CPUs),
+    "datalad.getexec.memory" (in MiB, default: all memory) and
+    "datalad.getexec.resource.<name>" for custom resources.
+
+    A command writing several files at once is registered for all of them
+    with repeated --output options. It then gets a directory instead of an
+    output path as its last argument, and has to write the outputs there.
+    The command is executed only once for all of them: the first retrieval
+    keeps the other outputs around for the following ones.
+
+    A command which can produce many targets in one call is marked with
+    --batch. Such a command gets the arguments given with --arg and the
+    output path of each target one after the other. It is still called for
+    single targets by :command:`datalad get`, but
+    :command:`datalad getexec-materialize` retrieves all missing targets
+    sharing the command with one call per chunk.
+
+    A command can be mapped over files with --map, registering it for one
+    output per file matching a glob pattern, all in a single commit. The
+    matching file becomes an input of its output. The target path, the
+    arguments given with --arg and the patterns given with --input-glob are
+    templates in which "{path}", "{dir}", "{name}", "{stem}" and "{suffix}"
+    are replaced with the path of the matching file relative to the dataset
+    root, its directory, its name, its name without suffix and its suffix.
+    Literal braces have to be doubled.
+
+    Similarly, parameter sweeps are registered with --param options, each
+    giving the values of one parameter. The command is registered for every
+    combination of the values, with "{NAME}" replaced by the value of the
+    parameter NAME. Combined with --map, every combination is registered for
+    every matching file. All outputs are computed right away, with --jobs
+    in parallel.
+
+    Inputs given with --input-glob are registered as patterns and only
+    expanded when they are fetched, so a command depending on thousands of
+    files does not need all of their paths in its URL. Inputs are fetched in
+    batches per dataset containing them.
+
+    Commands are executed in the root of the dataset and inherit the
+    environment of the process retrieving the file, unless a working
+    directory relative to the dataset root is given with --cwd, or the
+    environment is made explicit with --env and --env-allow. The latter
+    keeps results independent of whoever happens to retrieve them.
+
+    Limits on wall-clock time, CPU time and memory can be set for a command.
+    It is killed if it exceeds one of them, which is reported as a distinct
+    error.
+
+    A long-running command can save its progress with --checkpoint. It then
+    gets the path of a directory in the environment variable
+    GETEXEC_CHECKPOINT_DIR, which is kept if the command fails and removed
+    once it succeeds. GETEXEC_RESUME is "1" if the directory holds what an
+    earlier, failed attempt saved there, and "0" otherwise, so the command
+    can continue where that attempt stopped.
     """
 
     _examples_ = [
@@ -49,6 +140,21 @@ class GetExec(Interface):
             code_cmd="datalad getexec --path test.txt -- 'bash' '-c' 'printf "
             '"Hello World!" > "$1"\' \'test-cmd\'',
         ),
+        dict(
+            text="Use the output of a command on stdout as the file content",
+            code_py='getexec(["printf", "Hello World!"], path="output.txt", '
+            "stdout=True)",
+            code_cmd="datalad getexec --path output.txt --stdout -- "
+            "printf 'Hello World!'",
+        ),
+        dict(
+            text="Decompress, filter and sort a file in a pipeline",
+            code_py='getexec(["zcat", "in.gz", "|", "grep", "-v", "^#", "|", '
+            '"sort"], path="sorted.txt", inputs=["in.gz"], stdout=True, '
+            "pipeline=True)",
+            code_cmd="datalad getexec --path sorted.txt -i in.gz --stdout "
+            "--pipeline -- zcat in.gz '|' grep -v '^#' '|' sort",
+        ),
         dict(
             text="Run an executable script which depends on other files and register "
             "it for an output file",
@@ -57,18 +163,73 @@ class GetExec(Interface):
             code_cmd="datalad getexec --path output.txt --input input1.txt -i "
             "input2.txt -- 'code/script.sh' input1.txt input2.txt",
         ),
+        dict(
+            text="Register a script writing two files into the directory it is "
+            "given",
+            code_py='getexec(["code/split.sh"], path="parts", '
+            'outputs=["a.txt", "b.txt"])',
+            code_cmd="datalad getexec --path parts --output a.txt --output b.txt "
+            "-- code/split.sh",
+        ),
+        dict(
+            text="Register a conversion for every NIfTI file in a directory",
+            code_py='getexec(["code/convert.sh"], path="derived/{stem}.json", '
+            'map_glob="raw/*.nii", args=["{path}"])',
+            code_cmd="datalad getexec --map 'raw/*.nii' "
+            "--path 'derived/{stem}.json' --arg '{path}' -- code/convert.sh",
+        ),
+        dict(
+            text="Register a simulation for every combination of two parameters, "
+            "computing four of them in parallel",
+            code_py='getexec(["code/simulate.py"], path="sim/{n}-{seed}.csv", '
+            'params=["n=10,100,1000", "seed=1,2,3"], args=["{n}", "{seed}"], '
+            "jobs=4)",
+            code_cmd="datalad getexec --param n=10,100,1000 --param seed=1,2,3 "
+            "--path 'sim/{n}-{seed}.csv' --arg '{n}' --arg '{seed}' -J 4 "
+            "-- code/simulate.py",
+        ),
+        dict(
+            text="Run a script in a subdirectory, with a fixed environment",
+            code_py='getexec(["./build.sh"], path="lib/out.bin", cwd="lib", '
+            'env=["LC_ALL=C"], env_allow=["PATH", "HOME"])',
+            code_cmd="datalad getexec --path lib/out.bin --cwd lib --env LC_ALL=C "
+            "--env-allow PATH --env-allow HOME -- ./build.sh",
+        ),
+        dict(
+            text="Call a python function with an argument for an output file",
+            code_py='getexec(["input.csv"], path="output.json", '
+            'python="code.recipes:summarize", inputs=["input.csv"])',
+            code_cmd="datalad getexec --path output.json -i input.csv "
+            "--python code.recipes:summarize input.csv",
+        ),
+        dict(
+            text="Register an output of a long-running server command",
+            code_py='getexec(["Rscript", "code/server.R"], path="plot.png", '
+            'server=True, args=["subject01"])',
+            code_cmd="datalad getexec --path plot.png --server --arg subject01 "
+            "-- Rscript code/server.R",
+        ),
+        dict(
+            text="Register a command which needs 8 CPUs, 16 GiB of memory and a "
+            "GPU, and runs with a low priority",
+            code_py='getexec(["code/train.sh"], path="model.bin", cpus=8, '
+            'memory=16384, resources=["gpu=1"], nice=10, ionice="idle")',
+            code_cmd="datalad getexec --path model.bin --cpus 8 --memory 16384 "
+            "--resource gpu=1 --nice 10 --ionice idle -- code/train.sh",
+        ),
     ]
 
     _params_ = dict(
         cmd=Parameter(
             args=("cmd",),
-            nargs="+",
+            nargs="*",
             metavar="COMMAND",
             doc="""the command to execute and register. The first argument is
             the program to execute, the following arguments are passed to this
             program. It is expected that the program takes a target filename
             as its last argument, which is appended to the full command in the
-            special remote.""",
+            special remote. With [CMD: --python CMD][PY: `python` PY] all of
+            these are arguments for the python function.""",
             constraints=EnsureStr(),
         ),
         path=Parameter(
@@ -89,6 +250,16 @@ class GetExec(Interface):
             The dependencies will be registered in git-annex in a way that they will be
             fetched on subsequent :command:`get`s on the file created by getexec.""",
         ),
+        input_globs=Parameter(
+            args=("--input-glob",),
+            dest="input_globs",
+            metavar="PATTERN",
+            action="append",
+            doc="""a glob pattern for dependencies of the getexec command,
+            e.g. "raw/**/*.dcm". Only the pattern is registered, it is
+            expanded against the files tracked in the dataset and its
+            installed subdatasets whenever the dependencies are fetched.""",
+        ),
         dataset=Parameter(
             args=("-d", "--dataset"),
             metavar="PATH",
@@ -98,6 +269,165 @@ class GetExec(Interface):
             be saved in the dataset.""",
             constraints=EnsureDataset() | EnsureNone(),
         ),
+        args=Parameter(
+            args=("--arg",),
+            dest="args",
+            metavar="ARG",
+            action="append",
+            doc="""an argument specific to this output. It is passed after the
+            command and before the output path. Outputs of a server command
+            share the server, only these arguments are sent along with each
+            request.""",
+        ),
+        server=Parameter(
+            args=("--server",),
+            action="store_true",
+            doc="""the command is a long-running server which handles requests
+            for many outputs, see above for the protocol it has to speak.""",
+        ),
+        stdout=Parameter(
+            args=("--stdout",),
+            action="store_true",
+            doc="""the command writes the content of the target to stdout
+            instead of to a file named by an appended argument.""",
+        ),
+        pipeline=Parameter(
+            args=("--pipeline",),
+            action="store_true",
+            doc="""the command is a pipeline of stages separated by "|"
+            arguments.""",
+        ),
+        python=Parameter(
+            args=("--python",),
+            metavar="MODULE:FUNCTION",
+            doc="""an importable python function to call instead of executing a
+            command. Modules are imported relative to the dataset root, in
+            addition to the regular module search path.""",
+            constraints=EnsureStr() | EnsureNone(),
+        ),
+        outputs=Parameter(
+            args=("--output",),
+            dest="outputs",
+            metavar="NAME",
+            action="append",
+            doc="""a file written by a command producing several outputs,
+            relative to the directory the command gets instead of an output
+            path. Every output is registered as a file of the same name in the
+            directory given as [CMD: --path CMD][PY: `path` PY].""",
+        ),
+        batch=Parameter(
+            args=("--batch",),
+            action="store_true",
+            doc="""the command accepts many targets in one call, see
+            :command:`datalad getexec-materialize`.""",
+        ),
+        checkpoint=Parameter(
+            args=("--checkpoint",),
+            action="store_true",
+            doc="""the command can resume from what it saved in the directory
+            given in GETEXEC_CHECKPOINT_DIR.""",
+        ),
+        map_glob=Parameter(
+            args=("--map",),
+            dest="map_glob",
+            metavar="GLOB",
+            doc="""register the command once for every file in the dataset
+            matching this glob pattern, relative to the dataset root. The
+            matching file becomes an input, and the target path, the
+            arguments given with --arg and the --input-glob patterns are
+            templates, see above.""",
+            constraints=EnsureStr() | EnsureNone(),
+        ),
+        params=Parameter(
+            args=("--param",),
+            dest="params",
+            metavar="NAME=VALUE,...",
+            action="append",
+            doc="""an axis of a parameter sweep, registering the command for
+            every combination of the values of all axes. The target path and
+            the arguments given with --arg are templates, in which "{NAME}" is
+            replaced with the value.""",
+        ),
+        jobs=Parameter(
+            args=("-J", "--jobs"),
+            metavar="N",
+            doc="""number of outputs to compute in parallel when registering
+            many of them.""",
+            constraints=EnsureInt() | EnsureNone(),
+        ),
+        cwd=Parameter(
+            args=("--cwd",),
+            metavar="PATH",
+            doc="""working directory of the command, relative to the dataset
+            root.""",
+            constraints=EnsureStr() | EnsureNone(),
+        ),
+        env=Parameter(
+            args=("--env",),
+            metavar="NAME=VALUE",
+            action="append",
+            doc="""an environment variable to set for the command.""",
+        ),
+        env_allow=Parameter(
+            args=("--env-allow",),
+            metavar="NAME",
+            action="append",
+            doc="""name of an environment variable of the retrieving process
+            to pass on to the command, shell-style wildcards are allowed. If
+            given, all other variables are removed from the command's
+            environment.""",
+        ),
+        cpus=Parameter(
+            args=("--cpus",),
+            metavar="N",
+            doc="""number of CPUs the command uses.""",
+            constraints=EnsureInt() | EnsureNone(),
+        ),
+        memory=Parameter(
+            args=("--memory",),
+            metavar="MIB",
+            doc="""memory the command uses, in MiB.""",
+            constraints=EnsureInt() | EnsureNone(),
+        ),
+        resources=Parameter(
+            args=("--resource",),
+            dest="resources",
+            metavar="NAME=N",
+            action="append",
+            doc="""amount of a custom resource the command uses, e.g.
+            "gpu=1".""",
+        ),
+        nice=Parameter(
+            args=("--nice",),
+            metavar="N",
+            doc="""niceness to run the command with.""",
+            constraints=EnsureInt() | EnsureNone(),
+        ),
+        ionice=Parameter(
+            args=("--ionice",),
+            metavar="CLASS",
+            doc="""I/O scheduling class to run the command with, if the
+            ionice program is available.""",
+            constraints=EnsureChoice("realtime", "best-effort", "idle") | EnsureNone(),
+        ),
+        timeout=Parameter(
+            args=("--timeout",),
+            metavar="SECONDS",
+            doc="""wall-clock time after which the command is killed.""",
+            constraints=EnsureInt() | EnsureNone(),
+        ),
+        cpu_limit=Parameter(
+            args=("--cpu-limit",),
+            metavar="SECONDS",
+            doc="""CPU time after which the command is killed.""",
+            constraints=EnsureInt() | EnsureNone(),
+        ),
+        memory_limit=Parameter(
+            args=("--memory-limit",),
+            metavar="MIB",
+            doc="""memory in MiB above which the command is killed.""",
+            constraints=EnsureInt() | EnsureNone(),
+        ),
         message=Parameter(
             args=("-m", "--message"),
             doc="""commit message to use. If no commit message is given the specified
@@ -114,23 +444,238 @@ class GetExec(Interface):
         path: str,
         dataset: Optional[Dataset] = None,
         inputs: Optional[List[str]] = None,
+        input_globs: Optional[List[str]] = None,
+        args: Optional[List[str]] = None,
+        server: bool = False,
+        stdout: bool = False,
+        pipeline: bool = False,
+        python: Optional[str] = None,
+        cwd: Optional[str] = None,
+        env: Optional[List[str]] = None,
+        env_allow: Optional[List[str]] = None,
+        outputs: Optional[List[str]] = None,
+        batch: bool = False,
+        checkpoint: bool = False,
+        map_glob: Optional[str] = None,
+        params: Optional[List[str]] = None,
+        jobs: Optional[int] = None,
+        cpus: Optional[int] = None,
+        memory: Optional[int] = None,
+        resources: Optional[List[str]] = None,
+        nice: Optional[int] = None,
+        ionice: Optional[str] = None,
+        timeout: Optional[int] = None,
+        cpu_limit: Optional[int] = None,
+        memory_limit: Optional[int] = None,
         message: Optional[str] = None,
     ) -> Iterable[Dict]:
         ds = require_dataset(
             dataset, check_installed=True, purpose="execute and register a command"
         )
+        if not cmd and python is None:
+            yield get_status_dict(
+                action="getexec",
+                status="impossible",
+                message="no command given",
+            )
+            return
+        if server and python is not None:
+            yield get_status_dict(
+                action="getexec",
+                status="impossible",
+                message="a python function can not be registered as a server",
+            )
+            return
+        if stdout and (server or python is not None):
+            yield get_status_dict(
+                action="getexec",
+                status="impossible",
+                message="only commands can write their output to stdout",
+            )
+            return
+        if checkpoint and (server or python is not None):
+            yield get_status_dict(
+                action="getexec",
+                status="impossible",
+                message="only commands can be checkpointed",
+            )
+            return
+        limits = (timeout, cpu_limit, memory_limit)
+        if any(limit is not None for limit in limits) and (
+            server or python is not None
+        ):
+            yield get_status_dict(
+                action="getexec",
+                status="impossible",
+                message="limits can only be enforced for commands",
+            )
+            return
+        stages: List[List[str]] = [[]]
+        if pipeline:
+            if server or python is not None:
+                yield get_status_dict(
+                    action="getexec",
+                    status="impossible",
+                    message="only commands can be part of a pipeline",
+                )
+                return
+            for arg in cmd:
+                if arg == "|":
+                    stages.append([])
+                else:
+                    stages[-1].append(arg)
+            if not all(stages):
+                yield get_status_dict(
+                    action="getexec",
+                    status="impossible",
+                    message="empty stage in pipeline",
+                )
+                return
+            cmd = stages[-1]
         if inputs is None:
             inputs = []
-        spec = Spec(cmd, inputs)
+        if cwd is not None and not _within(cwd):
+            yield get_status_dict(
+                action="getexec",
+                status="impossible",
+                message="working directory {} is not within the dataset".format(cwd),
+            )
+            return
+        if batch and (stdout or outputs):
+            yield get_status_dict(
+                action="getexec",
+                status="impossible",
+                message="a batch command can not use stdout or several outputs",
+            )
+            return
+        if outputs:
+            if stdout:
+                yield get_status_dict(
+                    action="getexec",
+                    status="impossible",
+                    message="a command with several outputs can not use stdout",
+                )
+                return
+            invalid = [o for o in outputs if not _within(o) or o in (".", "")]
+            if invalid or len(set(outputs)) != len(outputs):
+                yield get_status_dict(
+                    action="getexec",
+                    status="impossible",
+                    message="invalid or duplicate outputs {}".format(invalid),
+                )
+                return
+        try:
+            resource_needs = parse_resources(resources)
+            env_vars = parse_env(env)
+            axes = parse_params(params)
+        except ValueError as e:
+            yield get_status_dict(action="getexec", status="impossible", message=str(e))
+            return
+        spec = Spec(
+            cmd,
+            inputs,
+            input_globs=input_globs,
+            pipeline=stages[:-1] or None,
+            python=python,
+            args=args,
+            server=server,
+            cpus=cpus,
+            memory=memory,
+            resources=resource_needs,
+            nice=nice,
+            ionice=ionice,
+            timeout=timeout,
+            cpu_limit=cpu_limit,
+            memory_limit=memory_limit,
+            stdout=stdout,
+            outputs=outputs,
+            batch=batch,
+            checkpoint=checkpoint,
+            cwd=cwd,
+            env=env_vars,
+            env_allow=env_allow,
+        )
         logger.debug("spec is %s", spec)
-        url = spec.to_url()
-        logger.debug("url is %s", url)
-
-        pathobj = ds.pathobj / path
-        logger.debug("target path is %s", pathobj)
+        if map_glob is not None:
+            matches = [
+                match
+                for match in ds.repo.call_git(
+                    ["ls-files", "-z", "--", ":(glob)" + map_glob]
+                ).split("\0")
+                if match
+            ]
+            if not matches:
+                yield get_status_dict(
+                    action="getexec",
+                    status="impossible",
+                    message="no files match {}".format(map_glob),
+                )
+                return
+        if map_glob is not None or axes:
+            try:
+                mapped = [
+                    expand_spec(spec, path, dict(match_fields, **point), match_inputs)
+                    for match_fields, match_inputs in (
+                        [(file_fields(match), [match]) for match in matches]
+                        if map_glob is not None
+                        else [({}, [])]
+                    )
+                    for point in sweep(axes)
+                ]
+            except (KeyError, IndexError, ValueError) as e:
+                yield get_status_dict(
+                    action="getexec",
+                    status="impossible",
+                    message="invalid template: {}".format(e),
+                )
+                return
+        else:
+            mapped = [(path, spec)]
+        targets = {}
+        for target_path, target_spec in mapped:
+            if outputs:
+                # one execution writes all of them, the first retrieval stages
+                # the others for the following ones
+                for output in outputs:
+                    targets[ds.pathobj / target_path / output] = dataclasses.replace(
+                        target_spec, output=output
+                    )
+            else:
+                targets[ds.pathobj / target_path] = target_spec
+        if len(targets) != len(mapped) * len(outputs or [None]):
+            yield get_status_dict(
+                action="getexec",
+                status="impossible",
+                message="several files map to the same target",
+            )
+            return
 
         ensure_special_remote_exists_and_is_enabled(ds.repo, "getexec")
-        ds.repo.add_url_to_file(pathobj, url)
+        if len(targets) == 1:
+            pathobj, target_spec = next(iter(targets.items()))
+            logger.debug("target path is %s", pathobj)
+            url = target_spec.to_url()
+            logger.debug("url is %s", url)
+            ds.repo.add_url_to_file(pathobj, url)
+        else:
+            failed = add_urls(
+                ds.repo,
+                jobs,
+                [
+                    (target_spec.to_url(), str(p.relative_to(ds.pathobj)))
+                    for p, target_spec in targets.items()
+                ],
+            )
+            for file, error in failed.items():
+                yield get_status_dict(
+                    action="getexec",
+                    path=str(ds.pathobj / file),
+                    status="error",
+                    message=error,
+                )
+                del targets[ds.pathobj / file]
+            if not targets:
+                return
         msg = """\
 [DATALAD GETEXEC] {}
 
@@ -138,21 +683,143 @@ class GetExec(Interface):
 {}
 ^^^ Do not change lines above ^^^
         """
-        cmd_message_full = "'" + "' '".join(spec.cmd) + "'"
+        cmd_message_full = " | ".join(
+            " ".join(
+                ([spec.python] if spec.python is not None else [])
+                + ["'" + arg + "'" for arg in stage]
+            )
+            for stage in (spec.pipeline or []) + [spec.cmd + (spec.args or [])]
+        )
         cmd_message = (
             cmd_message_full
             if len(cmd_message_full) <= 40
             else cmd_message_full[:40] + " ..."
         )
+        if len(mapped) > 1:
+            cmd_message += " for {} outputs".format(len(mapped))
         record = json.dumps(spec.to_dict(), indent=1, sort_keys=True)
         msg = msg.format(
             message if message is not None else cmd_message,
             record,
         )
-        yield ds.save(pathobj, message=msg)
+        yield ds.save(list(targets), message=msg)
         yield get_status_dict(action="getexec", status="ok")
 
 
+def add_urls(
+    repo: AnnexRepo, jobs: Optional[int], urls: List[Tuple[str, str]]
+) -> Dict[str, str]:
+    """Add many files from their URLs with a single git-annex process.
+
+    Returns the errors for files that could not be added. The batch mode of
+    AnnexRepo.add_url_to_file can not be used, it chokes on the info messages
+    the special remote sends while executing commands.
+    """
+    proc = subprocess.run(
+        [
+            "git",
+            "annex",
+            "addurl",
+            "--batch",
+            "--with-files",
+            "--json",
+            "--json-error-messages",
+        ]
+        + (["--jobs", str(jobs)] if jobs else []),
+        cwd=repo.path,
+        input="".join("{} {}\n".format(url, file) for url, file in urls),
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    errors = {file: "not added" for _, file in urls}
+    for line in proc.stdout.splitlines():
+        record = json.loads(line)
+        if record.get("command") != "addurl":
+            continue
+        if record.get("success"):
+            errors.pop(record["file"], None)
+        else:
+            errors[record["file"]] = " ".join(record.get("error-messages", [])) or (
+                "not added"
+            )
+    return errors
+
+
+def file_fields(match: str) -> Dict[str, str]:
+    """Template fields for a file matched by --map."""
+    match_path = PurePosixPath(match)
+    return {
+        "path": match,
+        "dir": str(match_path.parent),
+        "name": match_path.name,
+        "stem": match_path.stem,
+        "suffix": match_path.suffix,
+    }
+
+
+def sweep(axes: Dict[str, List[str]]) -> Iterator[Dict[str, str]]:
+    """Template fields for every point of the product of --param axes."""
+    for values in itertools.product(*axes.values()):
+        yield dict(zip(axes, values))
+
+
+def expand_spec(
+    spec: Spec, path: str, fields: Dict[str, str], inputs: List[str]
+) -> Tuple[str, Spec]:
+    """The target path and spec with templates filled in from fields."""
+    return (
+        path.format(**fields),
+        dataclasses.replace(
+            spec,
+            inputs=(spec.inputs or []) + inputs,
+            input_globs=[g.format(**fields) for g in spec.input_globs or []] or None,
+            args=[arg.format(**fields) for arg in spec.args or []] or None,
+        ),
+    )
+
+
+def parse_params(params: Optional[List[str]]) -> Dict[str, List[str]]:
+    result: Dict[str, List[str]] = {}
+    for param in params or []:
+        name, sep, values = param.partition("=")
+        if not sep or not name.isidentifier() or not values:
+            raise ValueError(
+                "invalid parameter '{}', expected NAME=VALUE,...".format(param)
+            )
+        result[name] = values.split(",")
+    return result
+
+
+def _within(path: str) -> bool:
+    return not os.path.isabs(path) and os.path.normpath(path).split(os.sep)[0] != ".."
+
+
+def parse_resources(resources: Optional[List[str]]) -> Optional[Dict[str, int]]:
+    if not resources:
+        return None
+    result = {}
+    for resource in resources:
+        name, sep, amount = resource.partition("=")
+        if not sep or not name or not amount.isdigit():
+            raise ValueError("invalid resource '{}', expected NAME=N".format(resource))
+        result[name] = int(amount)
+    return result
+
+
+def parse_env(env: Optional[List[str]]) -> Optional[Dict[str, str]]:
+    if not env:
+        return None
+    result = {}
+    for var in env:
+        name, sep, value = var.partition("=")
+        if not sep or not name:
+            raise ValueError(
+                "invalid environment variable '{}', expected NAME=VALUE".format(var)
+            )
+        result[name] = value
+    return result
+
+
 def ensure_special_remote_exists_and_is_enabled(
     repo: AnnexRepo, remote: Literal["getexec"]
 ) -> None:
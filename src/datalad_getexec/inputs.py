@@ -0,0 +1,111 @@
+"""Resolving and fetching the inputs of a spec
+
+Besides exact paths, which may also name directories, a spec can give its
+inputs as glob patterns. These are recorded as they are and only expanded
+against the tree, including installed subdatasets, when the inputs are
+needed, so a recipe depending on thousands of files keeps a short URL.
+
+Inputs are fetched per dataset containing them, in batches of at most
+``datalad.getexec.fetch-batch-size`` paths.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import subprocess
+from typing import Dict, Iterator, List, Optional
+
+from datalad_getexec import config
+from datalad_getexec.spec import Spec
+
+logger = logging.getLogger("datalad.getexec.inputs")
+
+
+def pathspecs(spec: Spec) -> List[str]:
+    """git pathspecs for the inputs of a spec, without expanding globs."""
+    return (spec.inputs or []) + [":(glob)" + g for g in spec.input_globs or []]
+
+
+def state(spec: Spec, cwd: Optional[str] = None) -> str:
+    """What identifies the current content of the inputs of a spec.
+
+    The index entries of annexed files name their keys, those of other files
+    the hash of their content, so this works without fetching anything.
+    """
+    if not spec.inputs and not spec.input_globs:
+        return ""
+    return subprocess.run(
+        ["git", "ls-files", "--stage", "--recurse-submodules", "--"] + pathspecs(spec),
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+    ).stdout
+
+
+def resolve(spec: Spec, cwd: Optional[str] = None) -> List[str]:
+    """The paths of the inputs of a spec, with glob patterns expanded.
+
+    Raises subprocess.CalledProcessError if the patterns can not be expanded.
+    """
+    paths = list(spec.inputs or [])
+    if spec.input_globs:
+        matches = subprocess.run(
+            ["git", "ls-files", "-z", "--recurse-submodules", "--"]
+            + [":(glob)" + g for g in spec.input_globs],
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        ).stdout.decode("utf-8")
+        known = set(paths)
+        paths.extend(m for m in matches.split("\0") if m and m not in known)
+    return paths
+
+
+def _dataset_root(path: str, cwd: str, roots: Dict[str, str]) -> str:
+    # the closest directory with a .git, not above cwd; uninstalled
+    # subdatasets have none, their content is fetched through the superdataset
+    directory = os.path.dirname(path)
+    if directory in roots:
+        return roots[directory]
+    if not directory or os.path.lexists(os.path.join(cwd, directory, ".git")):
+        root = directory
+    else:
+        root = _dataset_root(directory, cwd, roots)
+    roots[directory] = root
+    return root
+
+
+def by_dataset(paths: List[str], cwd: Optional[str] = None) -> Dict[str, List[str]]:
+    """Group paths by the dataset they are in, given by its path relative to
+    cwd, "" for the dataset at cwd."""
+    roots: Dict[str, str] = {}
+    groups: Dict[str, List[str]] = {}
+    for path in paths:
+        root = _dataset_root(os.path.normpath(path), cwd or ".", roots)
+        groups.setdefault(root, []).append(path)
+    return groups
+
+
+def _chunks(paths: List[str], size: int) -> Iterator[List[str]]:
+    for i in range(0, len(paths), size):
+        yield paths[i : i + size]
+
+
+def fetch(paths: List[str], cwd: Optional[str] = None) -> None:
+    import datalad.api as da
+    from datalad.utils import swallow_outputs
+
+    base = os.path.abspath(cwd or "")
+    size = config.get_int("fetch-batch-size") or 1000
+    for root, group in by_dataset(paths, cwd).items():
+        for chunk in _chunks(sorted(set(group)), size):
+            logger.info("fetching %d inputs in dataset %s", len(chunk), root or ".")
+            with swallow_outputs() as cm:
+                da.get(
+                    [os.path.join(base, path) for path in chunk],
+                    dataset=os.path.join(base, root),
+                )
+                logger.info("datalad get output: %s", cm.out)
@@ -0,0 +1,194 @@
+"""Checking content against git-annex keys
+
+git-annex verifies everything a special remote retrieves, but only after the
+special remote is done. Where the special remote has to choose between
+several results itself, it checks them against the key with this module.
+
+An ``OutputWatcher`` checks an output while the command is still writing it,
+so that a command producing more than the key's size is cancelled right away
+and a command producing different content is recognized without reading its
+output once more.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from functools import partial
+from typing import IO, Any, Callable, Dict, Optional
+
+logger = logging.getLogger("datalad.getexec.keys")
+
+_HASHES: Dict[str, Callable[[], Any]] = {
+    "MD5": hashlib.md5,
+    "SHA1": hashlib.sha1,
+    "SHA224": hashlib.sha224,
+    "SHA256": hashlib.sha256,
+    "SHA384": hashlib.sha384,
+    "SHA512": hashlib.sha512,
+    "SHA3_224": hashlib.sha3_224,
+    "SHA3_256": hashlib.sha3_256,
+    "SHA3_384": hashlib.sha3_384,
+    "SHA3_512": hashlib.sha3_512,
+}
+for _bits in (160, 224, 256, 384, 512):
+    _HASHES["BLAKE2B{}".format(_bits)] = partial(
+        hashlib.blake2b, digest_size=_bits // 8
+    )
+for _bits in (160, 224, 256):
+    _HASHES["BLAKE2S{}".format(_bits)] = partial(
+        hashlib.blake2s, digest_size=_bits // 8
+    )
+
+_KEY = re.compile(
+    r"^(?P<backend>[A-Z0-9_]+)(?P<fields>(-[a-zA-Z][^-]*)*)--(?P<name>.*)$"
+)
+
+
+@dataclass
+class Key:
+    backend: str
+    size: Optional[int]
+    name: str
+
+    @classmethod
+    def parse(cls, key: str) -> Key:
+        match = _KEY.match(key)
+        if match is None:
+            raise ValueError("invalid key {}".format(key))
+        size = None
+        for field in match.group("fields").split("-")[1:]:
+            if field.startswith("s"):
+                size = int(field[1:])
+        return cls(match.group("backend"), size, match.group("name"))
+
+    def hasher(self) -> Optional[Any]:
+        """A new hash object for the backend, None if it is not a supported
+        hashing backend."""
+        backend = self.backend
+        if backend.endswith("E") and backend[:-1] in _HASHES:
+            backend = backend[:-1]
+        factory = _HASHES.get(backend)
+        return factory() if factory is not None else None
+
+    @property
+    def digest(self) -> str:
+        # backends ending with E keep the extension of the file in the key
+        return self.name.split(".", 1)[0] if self.backend.endswith("E") else self.name
+
+
+class Verifier:
+    """Checks content passed in chunks against a key."""
+
+    def __init__(self, key: str) -> None:
+        self.key = Key.parse(key)
+        self.hasher = self.key.hasher()
+        self.size = 0
+
+    @property
+    def checks(self) -> bool:
+        """Whether the key tells anything about the content."""
+        return self.hasher is not None or self.key.size is not None
+
+    @property
+    def exceeded(self) -> bool:
+        return self.key.size is not None and self.size > self.key.size
+
+    def update(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.hasher is not None:
+            self.hasher.update(chunk)
+
+    def matches(self) -> bool:
+        if self.key.size is not None and self.size != self.key.size:
+            return False
+        return self.hasher is None or self.hasher.hexdigest() == self.key.digest
+
+
+def verify(key: str, path: str, chunk_size: int = 2**20) -> bool:
+    """Whether the file at ``path`` has the content of ``key``, as far as can
+    be told from the key."""
+    verifier = Verifier(key)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            verifier.update(chunk)
+    return verifier.matches()
+
+
+class OutputWatcher(threading.Thread):
+    """Follows an output while it is written, hashing what is appended.
+
+    Sets ``cancel`` once the output grows past the key's size. Outputs that
+    are replaced, truncated or rewritten can not be followed, ``finish`` then
+    tells nothing.
+    """
+
+    def __init__(
+        self, key: str, path: str, interval: float = 0.1, chunk_size: int = 2**20
+    ) -> None:
+        super().__init__(daemon=True)
+        self.verifier = Verifier(key)
+        self.path = path
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.cancel = threading.Event()
+        self.followed = True
+        self._file: Optional[IO[bytes]] = None
+        self._stopped = threading.Event()
+
+    @property
+    def exceeded(self) -> bool:
+        return self.verifier.exceeded
+
+    def _follow(self) -> None:
+        if self._file is None:
+            try:
+                self._file = open(self.path, "rb")
+            except FileNotFoundError:
+                return
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if (
+            stat is None
+            or stat.st_ino != os.fstat(self._file.fileno()).st_ino
+            or stat.st_size < self.verifier.size
+        ):
+            logger.debug("%s was replaced or truncated, not following it", self.path)
+            self.followed = False
+            return
+        while not self.verifier.exceeded:
+            chunk = self._file.read(self.chunk_size)
+            if not chunk:
+                break
+            self.verifier.update(chunk)
+        if self.verifier.exceeded:
+            self.cancel.set()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self._follow()
+            if self.exceeded or not self.followed:
+                return
+
+    def finish(self) -> Optional[bool]:
+        """Whether the output matches the key, None if that is unknown."""
+        self._stopped.set()
+        self.join()
+        if self.followed and not self.exceeded:
+            self._follow()
+        if self._file is not None:
+            self._file.close()
+        if self.exceeded:
+            return False
+        if not self.followed or self._file is None:
+            return None
+        return self.verifier.matches()
@@ -0,0 +1,145 @@
+"""Enforcing per-spec limits on executions
+
+The CPU time limit is enforced by the kernel with RLIMIT_CPU. Wall-clock time
+and the memory of the command's process group are watched by a monitor
+thread, which terminates the group once it exceeds its limit. Where a
+delegated cgroup v2 subtree is available, the memory limit is additionally set
+as the cgroup's memory.max, which the kernel enforces without delay.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import resource
+import subprocess
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from datalad_getexec.process import group_rss, terminate_group
+
+logger = logging.getLogger("datalad.getexec.limits")
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+
+@dataclass
+class Limits:
+    timeout: Optional[int] = None
+    cpu_time: Optional[int] = None
+    # in MiB
+    memory: Optional[int] = None
+
+
+class Cgroup:
+    """A transient cgroup v2 for a single execution."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    @classmethod
+    def create(cls, memory: int) -> Optional[Cgroup]:
+        try:
+            with open("/proc/self/cgroup") as f:
+                own = [line for line in f.read().splitlines() if line.startswith("0::")]
+            if not own:
+                return None
+            parent = CGROUP_ROOT / own[0][3:].lstrip("/")
+            if "memory" not in (parent / "cgroup.controllers").read_text().split():
+                return None
+            path = parent / "getexec-{}".format(uuid.uuid4())
+            path.mkdir()
+        except OSError:
+            return None
+        cgroup = cls(path)
+        try:
+            (path / "memory.max").write_text(str(memory * 2**20))
+            (path / "memory.swap.max").write_text("0")
+        except OSError as e:
+            logger.debug("could not set up cgroup %s: %s", path, e)
+            cgroup.remove()
+            return None
+        return cgroup
+
+    def join(self) -> None:
+        # called in the child before exec, the monitor still watches the
+        # memory limit if this fails
+        try:
+            (self.path / "cgroup.procs").write_text(str(os.getpid()))
+        except OSError:
+            pass
+
+    def oom_killed(self) -> bool:
+        try:
+            events = (self.path / "memory.events").read_text().split()
+        except OSError:
+            return False
+        counts = dict(zip(events[::2], events[1::2]))
+        return int(counts.get("oom_kill", "0")) > 0
+
+    def remove(self) -> None:
+        try:
+            self.path.rmdir()
+        except OSError as e:
+            logger.debug("could not remove cgroup %s: %s", self.path, e)
+
+
+def set_rlimits(limits: Limits) -> None:
+    # called in the child before exec; the hard limit is slightly higher so
+    # the command gets SIGXCPU first, which is how we recognize it
+    if limits.cpu_time is not None:
+        resource.setrlimit(resource.RLIMIT_CPU, (limits.cpu_time, limits.cpu_time + 1))
+
+
+class Monitor(threading.Thread):
+    """Terminates a process group once it exceeds its wall-clock or memory
+    limit, or once ``cancel`` is set."""
+
+    def __init__(
+        self,
+        proc: subprocess.Popen,
+        limits: Limits,
+        interval: float = 0.2,
+        grace: float = 5,
+        cancel: Optional[threading.Event] = None,
+    ) -> None:
+        super().__init__(daemon=True)
+        self.proc = proc
+        self.limits = limits
+        self.interval = interval
+        self.grace = grace
+        self.cancel = cancel
+        self.exceeded: Optional[str] = None
+        self._stopped = threading.Event()
+
+    def _kill(self, limit: str) -> None:
+        logger.info("%s exceeded its %s limit, terminating it", self.proc.args, limit)
+        self.exceeded = limit
+        terminate_group(self.proc.pid, self.grace)
+
+    def run(self) -> None:
+        start = time.monotonic()
+        while not self._stopped.wait(self.interval):
+            if self.cancel is not None and self.cancel.is_set():
+                logger.info("cancelling %s", self.proc.args)
+                terminate_group(self.proc.pid, self.grace)
+                return
+            if (
+                self.limits.timeout is not None
+                and time.monotonic() - start > self.limits.timeout
+            ):
+                self._kill("timeout")
+                return
+            if (
+                self.limits.memory is not None
+                and group_rss(self.proc.pid) > self.limits.memory * 2**20
+            ):
+                self._kill("memory")
+                return
+
+    def stop(self) -> None:
+        self._stopped.set()
@@ -0,0 +1,227 @@
+"""DataLad getexec-materialize command"""
+
+__docformat__ = "restructuredtext"
+
+import dataclasses
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from datalad.distribution.dataset import (
+    Dataset,
+    EnsureDataset,
+    datasetmethod,
+    require_dataset,
+    resolve_path,
+)
+from datalad.interface.base import Interface, build_doc, eval_results
+from datalad.interface.results import get_status_dict
+from datalad.runner.exception import CommandError
+from datalad.support.constraints import EnsureInt, EnsureNone, EnsureStr
+from datalad.support.param import Parameter
+
+from datalad_getexec import config
+from datalad_getexec.execution import ExecutionError, Executor
+from datalad_getexec.spec import Spec
+
+logger = logging.getLogger("datalad.getexec.materialize")
+
+
+@build_doc
+class GetExecMaterialize(Interface):
+    """Retrieve files registered with getexec, batching commands where possible
+
+    Files are retrieved like with :command:`datalad get`, except for those
+    registered for a command marked as a batch command with the --batch
+    option of getexec. Such a command accepts many targets in one call:
+    instead of a single output path, it gets the arguments and output path of
+    each target one after the other. Missing files sharing such a command are
+    collected and retrieved with one call per chunk of targets, which
+    amortizes the startup and shared loading of the command over all of
+    them.
+
+    The outputs are verified against the keys of their files before they are
+    moved into the annex.
+    """
+
+    _examples_ = [
+        dict(
+            text="Retrieve all missing files of a directory",
+            code_py='getexec_materialize("thumbnails")',
+            code_cmd="datalad getexec-materialize thumbnails",
+        ),
+        dict(
+            text="Retrieve missing files with at most 1000 targets per call",
+            code_py='getexec_materialize("thumbnails", batch_size=1000)',
+            code_cmd="datalad getexec-materialize --batch-size 1000 thumbnails",
+        ),
+    ]
+
+    _params_ = dict(
+        path=Parameter(
+            args=("path",),
+            metavar="PATH",
+            nargs="*",
+            doc="""files or directories to retrieve. Defaults to the whole
+            dataset.""",
+            constraints=EnsureStr() | EnsureNone(),
+        ),
+        dataset=Parameter(
+            args=("-d", "--dataset"),
+            metavar="PATH",
+            doc="""specify the dataset to retrieve files in. If no dataset is
+            given, an attempt is made to identify the dataset based on the
+            current working directory.""",
+            constraints=EnsureDataset() | EnsureNone(),
+        ),
+        batch_size=Parameter(
+            args=("--batch-size",),
+            metavar="N",
+            doc="""maximum number of targets per call of a batch command.
+            Defaults to the value of the configuration item
+            "datalad.getexec.batch-size", or 100.""",
+            constraints=EnsureInt() | EnsureNone(),
+        ),
+    )
+
+    @staticmethod
+    @datasetmethod(name="getexec_materialize")
+    @eval_results
+    def __call__(
+        path: Optional[List[str]] = None,
+        dataset: Optional[Dataset] = None,
+        batch_size: Optional[int] = None,
+    ) -> Iterable[Dict]:
+        ds = require_dataset(dataset, check_installed=True, purpose="retrieve files")
+        if batch_size is None:
+            batch_size = config.get_int("batch-size", 100)
+        if batch_size is None or batch_size < 1:
+            yield get_status_dict(
+                action="getexec-materialize",
+                status="impossible",
+                message="the batch size must be at least 1",
+            )
+            return
+        groups: Dict[str, List[Tuple[Spec, str]]] = {}
+        rest = []
+        for record in ds.repo.call_annex_records(
+            ["whereis", "--not", "--in=here"],
+            files=[str(resolve_path(p, dataset)) for p in path or [ds.path]],
+        ):
+            spec = _batch_spec_of(record)
+            if spec is None:
+                rest.append(record["file"])
+            else:
+                groups.setdefault(batch_id(spec), []).append((spec, record["file"]))
+        executor = Executor()
+        try:
+            for targets in groups.values():
+                for i in range(0, len(targets), batch_size):
+                    yield from _materialize(ds, executor, targets[i : i + batch_size])
+        finally:
+            executor.close()
+        if rest:
+            yield from ds.get(
+                rest,
+                return_type="generator",
+                on_failure="ignore",
+                result_renderer="disabled",
+            )
+
+
+def _batch_spec_of(record: Dict) -> Optional[Spec]:
+    for remote in record.get("whereis", []):
+        for url in remote.get("urls", []):
+            if not url.startswith("getexec:"):
+                continue
+            try:
+                spec = Spec.from_url(url)
+            except ValueError:
+                continue
+            if spec.batch:
+                return spec
+    return None
+
+
+def batch_id(spec: Spec) -> str:
+    """Fingerprint of what the specs of a batch have in common."""
+    return dataclasses.replace(
+        spec, args=None, inputs=None, input_globs=None
+    ).fingerprint()
+
+
+def batch_spec(targets: List[Tuple[Spec, str]]) -> Tuple[Spec, str]:
+    """Combine the specs of a batch, returning the combined spec and the
+    target to execute it for.
+
+    The command gets the arguments and the target of each spec in turn, the
+    inputs of all of them are fetched.
+    """
+    args: List[str] = []
+    inputs = set()
+    input_globs = set()
+    for spec, target in targets:
+        args.extend((spec.args or []) + [target])
+        inputs.update(spec.inputs or [])
+        input_globs.update(spec.input_globs or [])
+    last = args.pop()
+    spec = dataclasses.replace(
+        targets[0][0],
+        args=args,
+        inputs=sorted(inputs),
+        input_globs=sorted(input_globs) or None,
+    )
+    return spec, last
+
+
+def _materialize(
+    ds: Dataset, executor: Executor, targets: List[Tuple[Spec, str]]
+) -> Iterable[Dict]:
+    files = [file for _, file in targets]
+    logger.info("retrieving %d files in one batch", len(files))
+    tmp_root = Path(ds.repo.dot_git) / "getexec" / "tmp"
+    tmp_root.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=str(tmp_root)))
+    try:
+        outputs = [str(tmp / str(i)) for i in range(len(targets))]
+        spec, last = batch_spec(
+            [(spec, output) for (spec, _), output in zip(targets, outputs)]
+        )
+        try:
+            result = executor.run(spec, last, ds.path)
+        except ExecutionError as e:
+            error: Optional[str] = str(e)
+        else:
+            error = None
+            if result.limit_exceeded is not None:
+                error = "exceeded {} limit".format(result.limit_exceeded)
+            elif result.returncode != 0:
+                error = "command exited with {}".format(result.returncode)
+        if error is None:
+            pairs = [
+                arg
+                for output, file in zip(outputs, files)
+                if Path(output).exists()
+                for arg in (output, file)
+            ]
+            try:
+                if pairs:
+                    ds.repo.call_annex(["reinject"] + pairs)
+            except CommandError as e:
+                logger.debug("reinject failed for some files: %s", e)
+        for file, present in zip(files, ds.repo.file_has_content(files)):
+            yield get_status_dict(
+                action="getexec-materialize",
+                path=str(ds.pathobj / file),
+                type="file",
+                status="ok" if present else "error",
+                message=(
+                    None
+                    if present
+                    else error or "output missing or not matching the key"
+                ),
+            )
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
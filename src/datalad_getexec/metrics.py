@@ -0,0 +1,93 @@
+"""Recorded costs of recipes and their inputs
+
+The durations of successful executions are recorded per spec fingerprint, and
+the time it took to fetch missing inputs per input path, in
+``.git/getexec/metrics.json``. If several recipes are registered for a key,
+the special remote uses them to try the cheapest one first.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from datalad_getexec import config, inputs
+from datalad_getexec.spec import Spec
+from datalad_getexec.utils import load_json, locked_json
+
+logger = logging.getLogger("datalad.getexec.metrics")
+
+# assumed time to fetch an input nothing is known about, in seconds
+DEFAULT_FETCH_COST = 10.0
+
+
+class MetricsStore:
+    def __init__(self, directory: Path) -> None:
+        self._path = directory / "metrics.json"
+
+    @classmethod
+    def for_dataset(cls, cwd: Optional[str] = None) -> MetricsStore:
+        return cls(config.dataset_dir(cwd))
+
+    def load(self) -> Dict[str, Any]:
+        metrics = load_json(self._path)
+        metrics.setdefault("recipes", {})
+        metrics.setdefault("inputs", {})
+        return metrics
+
+    @contextmanager
+    def _update(self) -> Iterator[Dict[str, Any]]:
+        with locked_json(self._path) as metrics:
+            metrics.setdefault("recipes", {})
+            metrics.setdefault("inputs", {})
+            yield metrics
+
+    def record_run(self, fingerprint: str, duration: float) -> None:
+        with self._update() as metrics:
+            recipe = metrics["recipes"].setdefault(
+                fingerprint, {"runs": 0, "duration": 0.0}
+            )
+            recipe["runs"] += 1
+            # running mean
+            recipe["duration"] += (duration - recipe["duration"]) / recipe["runs"]
+
+    def record_fetch(self, inputs: List[str], duration: float) -> None:
+        if not inputs:
+            return
+        with self._update() as metrics:
+            for path in inputs:
+                metrics["inputs"][path] = duration / len(inputs)
+
+
+def missing_inputs(paths: List[str], cwd: Optional[str] = None) -> List[str]:
+    # annexed files without content are dangling symlinks
+    return [path for path in paths if not os.path.exists(os.path.join(cwd or "", path))]
+
+
+def estimate(
+    spec: Spec, metrics: Dict[str, Any], cwd: Optional[str] = None
+) -> Tuple[Optional[float], str]:
+    """Estimated cost of retrieving a key with a spec, in seconds, and the
+    reason for it. The cost is None if the spec has never been executed."""
+    recipe = metrics["recipes"].get(spec.fingerprint())
+    try:
+        paths = inputs.resolve(spec, cwd)
+    except subprocess.CalledProcessError:
+        paths = spec.inputs or []
+    missing = missing_inputs(paths, cwd)
+    fetch_cost = sum(
+        metrics["inputs"].get(path, DEFAULT_FETCH_COST) for path in missing
+    )
+    reason = "{} of {} inputs missing (+{:.1f}s)".format(
+        len(missing), len(paths), fetch_cost
+    )
+    if recipe is None:
+        return None, "never executed, " + reason
+    return (
+        recipe["duration"] + fetch_cost,
+        "ran in {:.1f}s on average, {}".format(recipe["duration"], reason),
+    )
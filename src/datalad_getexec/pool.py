@@ -0,0 +1,97 @@
+"""Warm worker processes for python callable specs
+
+Starting a fresh interpreter and importing e.g. numpy for every retrieval
+easily costs seconds. Workers are forked from a forkserver which has the
+configured modules already imported, and are reused for all retrievals of
+the process owning the pool from the same working directory. Recipes are
+imported relative to it, so workers are never shared between directories,
+where modules of the same name might differ.
+"""
+
+from __future__ import annotations
+
+import importlib
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from datalad_getexec.execution import ExecutionResult
+
+logger = logging.getLogger("datalad.getexec.pool")
+
+
+def _resolve(name: str) -> object:
+    module_name, _, function_name = name.partition(":")
+    if not module_name or not function_name:
+        raise ValueError("expected 'module:function', got '{}'".format(name))
+    function = importlib.import_module(module_name)
+    for attribute in function_name.split("."):
+        function = getattr(function, attribute)
+    return function
+
+
+def _initialize(cwd: str) -> None:
+    # runs in the worker process; stdout is inherited from whoever started
+    # the forkserver, for the special remote that is the channel to
+    # git-annex, which a stray print() in a recipe must not write to
+    os.dup2(2, 1)
+    os.chdir(cwd)
+    sys.path.insert(0, cwd)
+
+
+def _call(name: str, args: List[str], cwd: str) -> Tuple[Optional[str], float, int]:
+    # runs in the worker process, recipes might have changed directory
+    os.chdir(cwd)
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    error = None
+    try:
+        function = _resolve(name)
+        function(*args)  # type: ignore[operator]
+    except Exception:
+        error = traceback.format_exc()
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_time = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return error, cpu_time, after.ru_maxrss
+
+
+class PythonWorkerPool:
+    def __init__(self, preload: List[str], cwd: str, max_workers: Optional[int] = None):
+        self.cwd = cwd
+        context: multiprocessing.context.BaseContext
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            forkserver = multiprocessing.get_context("forkserver")
+            forkserver.set_forkserver_preload(preload)
+            context = forkserver
+        else:  # pragma: no cover
+            context = multiprocessing.get_context("spawn")
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=context,
+            initializer=_initialize,
+            initargs=(cwd,),
+        )
+
+    def run(self, name: str, args: List[str]) -> ExecutionResult:
+        logger.debug("calling %s with %s in %s", name, args, self.cwd)
+        start = time.monotonic()
+        error, cpu_time, max_rss = self._executor.submit(
+            _call, name, args, self.cwd
+        ).result()
+        duration = time.monotonic() - start
+        if error is not None:
+            logger.info("calling %s failed:\n%s", name, error)
+        return ExecutionResult(
+            returncode=0 if error is None else 1,
+            duration=duration,
+            cpu_time=cpu_time,
+            max_rss=max_rss,
+        )
+
+    def close(self) -> None:
+        self._executor.shutdown()
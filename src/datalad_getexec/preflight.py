@@ -0,0 +1,125 @@
+"""Cheap checks whether a spec can be executed here
+
+Retrieving a key from the getexec special remote can take long before it
+fails: inputs are fetched first, and only then does it turn out that the
+command is not installed on this machine. The preflight tells that in
+advance, from what can be found out without fetching or executing anything:
+whether the executables of a spec (or the module of a python function) can
+be found, and whether git-annex knows of a copy of every annexed input.
+
+Results are cached for the lifetime of a ``Preflight``, i.e. of the special
+remote process, which git-annex keeps around for a whole ``get``.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from datalad_getexec.execution import command_env
+from datalad_getexec.inputs import resolve
+from datalad_getexec.spec import Spec
+
+logger = logging.getLogger("datalad.getexec.preflight")
+
+
+def _module_found(name: str, cwd: str) -> bool:
+    # python workers import from the working directory as well; only the top
+    # level package is looked up to not import anything
+    top = name.partition(":")[0].split(".")[0]
+    if (Path(cwd) / top).is_dir() or (Path(cwd) / (top + ".py")).is_file():
+        return True
+    try:
+        return importlib.util.find_spec(top) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _executable_found(name: str, cwd: str, path: Optional[str]) -> bool:
+    if os.sep in name:
+        # possibly an annexed script, which is fetched along with the inputs
+        return os.path.lexists(os.path.join(cwd, name))
+    # where executing it would look without a PATH as well
+    return shutil.which(name, path=path or os.defpath) is not None
+
+
+class Preflight:
+    def __init__(self, cwd: Optional[str] = None, executables: bool = True) -> None:
+        self.cwd = cwd or os.getcwd()
+        # executables are not checked where commands are executed elsewhere
+        self.executables = executables
+        self._specs: Dict[str, Optional[str]] = {}
+        self._inputs: Dict[str, Optional[str]] = {}
+
+    def check(self, spec: Spec) -> Optional[str]:
+        """Why the spec can not be executed, None if nothing speaks against
+        it."""
+        id = spec.fingerprint()
+        if id not in self._specs:
+            reason = self._check_executables(spec) if self.executables else None
+            self._specs[id] = reason or self._check_inputs(spec)
+            if self._specs[id] is not None:
+                logger.info("preflight failed for %s: %s", spec.cmd, self._specs[id])
+        return self._specs[id]
+
+    def _check_executables(self, spec: Spec) -> Optional[str]:
+        cwd = os.path.join(self.cwd, spec.cwd or "")
+        if spec.python is not None:
+            if not _module_found(spec.python, cwd):
+                return "python module of {} not found".format(spec.python)
+            return None
+        env = command_env(spec)
+        path = (os.environ if env is None else env).get("PATH")
+        for cmd in (spec.pipeline or []) + [spec.cmd]:
+            if cmd and not _executable_found(cmd[0], cwd, path):
+                return "executable {} not found".format(cmd[0])
+        return None
+
+    def _check_inputs(self, spec: Spec) -> Optional[str]:
+        try:
+            inputs = resolve(spec, self.cwd)
+        except subprocess.CalledProcessError:
+            return "input globs {} can not be expanded".format(spec.input_globs)
+        unknown = [i for i in inputs if i not in self._inputs]
+        if unknown:
+            lost = self._lost(unknown)
+            for input in unknown:
+                prefix = input.rstrip("/") + "/"
+                self._inputs[input] = next(
+                    (f for f in lost if f == input or f.startswith(prefix)), None
+                )
+        for input in inputs:
+            lost_file = self._inputs[input]
+            if lost_file is not None:
+                return "no copy of input {} known".format(lost_file)
+        return None
+
+    def _lost(self, inputs: List[str], chunk_size: int = 1000) -> List[str]:
+        """Annexed files among or below inputs git-annex knows no copy of."""
+        # files not annexed, or in subdatasets, get no records and count as
+        # available, as do inputs that whereis fails for
+        output = ""
+        for i in range(0, len(inputs), chunk_size):
+            output += subprocess.run(
+                ["git", "annex", "whereis", "--json", "--"]
+                + inputs[i : i + chunk_size],
+                cwd=self.cwd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True,
+            ).stdout
+        lost = []
+        for line in output.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if not record.get("whereis") and not record.get("untrusted"):
+                lost.append(record["file"])
+        return lost
@@ -0,0 +1,148 @@
+"""Process groups of running executions
+
+Every command is started in a process group of its own, so that it and
+everything it spawns (e.g. the pipelines of a ``bash -c``) can be torn down as
+a whole.
+Running executions are registered here, so that they can be cleaned up,
+including their partially written outputs, when the owning process is told
+to terminate.
+"""
+
+import logging
+import os
+import shutil
+import signal
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger("datalad.getexec.process")
+
+# reentrant, the signal handler may interrupt the main thread holding it
+_lock = threading.RLock()
+_groups: Set[int] = set()
+_outputs: Set[str] = set()
+
+
+def _members(pgid: int) -> Optional[Dict[int, str]]:
+    """The processes in a group and their states, None if unknown."""
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return None
+    members = {}
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/{}/stat".format(entry)) as f:
+                stat = f.read().rpartition(")")[2].split()
+            if int(stat[2]) == pgid:
+                members[int(entry)] = stat[0]
+        except (OSError, IndexError, ValueError):
+            continue
+    return members
+
+
+def group_alive(pgid: int) -> bool:
+    """Whether any process of a group is still running; zombies do not
+    count, whoever has to reap them might be busy waiting for us."""
+    try:
+        os.killpg(pgid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    members = _members(pgid)
+    return members is None or any(state != "Z" for state in members.values())
+
+
+def group_rss(pgid: int) -> int:
+    """Resident set size of all processes in a group in bytes, 0 if unknown."""
+    total = 0
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for pid in _members(pgid) or {}:
+        try:
+            with open("/proc/{}/statm".format(pid)) as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+def terminate_group(pgid: int, grace: float = 5) -> None:
+    """Send SIGTERM to a process group, and SIGKILL if it is still around
+    after ``grace`` seconds."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(pgid, sig)
+        except ProcessLookupError:
+            return
+        deadline = time.monotonic() + grace
+        while time.monotonic() < deadline:
+            if not group_alive(pgid):
+                return
+            time.sleep(0.05)
+    logger.debug("process group %d did not terminate", pgid)
+
+
+def register_group(pgid: int) -> None:
+    with _lock:
+        _groups.add(pgid)
+
+
+def unregister_group(pgid: int) -> None:
+    with _lock:
+        _groups.discard(pgid)
+
+
+def register_output(path: str) -> None:
+    with _lock:
+        _outputs.add(path)
+
+
+def unregister_output(path: str) -> None:
+    with _lock:
+        _outputs.discard(path)
+
+
+def remove_output(path: str) -> None:
+    """Remove a partial output, which is a directory for multi-output
+    recipes."""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        Path(path).unlink(missing_ok=True)
+
+
+def terminate_all(grace: float = 5) -> None:
+    """Tear down all running executions and remove their partial outputs."""
+    with _lock:
+        groups = list(_groups)
+        outputs = list(_outputs)
+        _groups.clear()
+        _outputs.clear()
+    for pgid in groups:
+        logger.info("terminating process group %d", pgid)
+        terminate_group(pgid, grace)
+    for output in outputs:
+        remove_output(output)
+
+
+def install_signal_handlers(grace: float = 5) -> None:
+    """Terminate running executions before exiting on a signal.
+
+    Only the main thread can do this, elsewhere it is up to whoever owns it.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        logger.debug("not in the main thread, not installing signal handlers")
+        return
+
+    def handler(signum: int, frame: object) -> None:
+        terminate_all(grace)
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, handler)
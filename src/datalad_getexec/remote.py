@@ -1,26 +1,76 @@
 import inspect
 import logging
-import subprocess
-from typing import List
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
 from annexremote import Master, RemoteError, SpecialRemote
 
+from datalad_getexec import (
+    config,
+    daemon,
+    failures,
+    keys,
+    metrics,
+    preflight,
+    process,
+    singleflight,
+    spool,
+)
+from datalad_getexec.execution import ExecutionError, Executor
 from datalad_getexec.spec import Spec
 
 logger = logging.getLogger("datalad.getexec.remote")
 
 GETEXEC_REMOTE_UUID = "1da43985-0b3e-4123-89f0-90b88021ed34"
 
+# a day, to not wait forever for jobs no worker is there for
+DEFAULT_SPOOL_TIMEOUT = 86400.0
+
 
 class HandleUrlError(Exception):
     pass
 
 
+class ExecutionFailed(RemoteError):
+    """The command of a recipe was executed, but failed."""
+
+    def __init__(
+        self, reason: str, returncode: Optional[int], stderr_tail: Optional[str]
+    ) -> None:
+        super().__init__(reason, returncode, stderr_tail)
+        self.reason = reason
+        self.returncode = returncode
+        self.stderr_tail = stderr_tail or ""
+
+    def __str__(self) -> str:
+        return _with_tail(self.reason, self.stderr_tail)
+
+
+def _with_tail(message: str, stderr_tail: Optional[str], lines: int = 5) -> str:
+    # messages to git-annex have to fit on one line
+    tail = [line for line in (stderr_tail or "").splitlines() if line.strip()]
+    if not tail:
+        return message
+    return "{}, stderr ended with: {}".format(message, " | ".join(tail[-lines:]))
+
+
 class GetExecRemote(SpecialRemote):
     # explicitly disable unsupported operations
     transfer_store = None
     remove = None
 
+    def __init__(self, annex: Master) -> None:
+        super().__init__(annex)
+        self.executor = Executor()
+        # commands submitted to a spool may be executed on other machines
+        self.preflight = preflight.Preflight(
+            executables=config.get("spool-dir") is None
+        )
+
     def initremote(self) -> None:
         # setting the uuid here unfortunately does not work, initremote is
         # executed to late
@@ -30,28 +80,267 @@ class GetExecRemote(SpecialRemote):
     def prepare(self) -> None:
         pass
 
-    def _execute_cmd(self, cmd: List[str]) -> None:
-        logger.debug("executing %s", cmd)
-        self.annex.info("executing {}".format(cmd))
-        result = subprocess.run(cmd, stdout=subprocess.PIPE)
-        logger.info(result.stdout)
+    def _watch(self, key: str, filename: str) -> Optional[keys.OutputWatcher]:
+        try:
+            watcher = keys.OutputWatcher(key, filename)
+        except ValueError:
+            return None
+        if not watcher.verifier.checks:
+            return None
+        # a partial output left by an earlier attempt would be mistaken for
+        # the beginning of this one
+        process.remove_output(filename)
+        watcher.start()
+        return watcher
+
+    def _execute_spec(self, spec: Spec, filename: str, key: str) -> None:
+        cmd = " | ".join(
+            str(stage) for stage in (spec.pipeline or []) + [spec.command(filename)]
+        )
+        if spec.python is not None:
+            self.annex.info("calling {} with {}".format(spec.python, cmd))
+        else:
+            self.annex.info("executing {}".format(cmd))
+        # outputs of multi-output recipes, and ones written to a scratch
+        # directory, are only moved into place at the end
+        watcher = (
+            self._watch(key, filename)
+            if spec.output is None and not config.get("scratch-dir")
+            else None
+        )
+        try:
+            result = self.executor.run(
+                spec, filename, cancel=watcher.cancel if watcher is not None else None
+            )
+        except ExecutionError as e:
+            raise RemoteError("Failed to execute {}: {}".format(cmd, e)) from e
+        finally:
+            matches = watcher.finish() if watcher is not None else None
+        for i, stage in enumerate(result.stages or []):
+            logger.info(
+                "stage %d %s exited with %d after %.2fs using %.2fs cpu time",
+                i,
+                stage["cmd"],
+                stage["returncode"],
+                stage["duration"],
+                stage["cpu_time"],
+            )
+        if watcher is not None and watcher.exceeded:
+            process.remove_output(filename)
+            raise ExecutionFailed(
+                "Output of {} exceeded the {} bytes of key {}".format(
+                    cmd, watcher.verifier.key.size, key
+                ),
+                result.returncode,
+                result.stderr_tail,
+            )
+        if result.limit_exceeded is not None:
+            raise ExecutionFailed(
+                "Exceeded {} limit executing {}".format(result.limit_exceeded, cmd),
+                result.returncode,
+                result.stderr_tail,
+            )
         if result.returncode != 0:
-            raise RemoteError("Failed to execute {}".format(cmd))
+            failed = [
+                "stage {} exited with {}".format(i, stage["returncode"])
+                for i, stage in enumerate(result.stages or [])
+                if stage["returncode"] != 0
+            ]
+            raise ExecutionFailed(
+                "Failed to execute {}{}".format(
+                    cmd, " ({})".format(", ".join(failed)) if failed else ""
+                ),
+                result.returncode,
+                result.stderr_tail,
+            )
+        # a mismatch may also come from a command rewriting what it wrote,
+        # only a second pass over the output can tell
+        if matches is False and not keys.verify(key, filename):
+            process.remove_output(filename)
+            raise ExecutionFailed(
+                "Output of {} does not match key {}, "
+                "is the command deterministic?".format(cmd, key),
+                result.returncode,
+                result.stderr_tail,
+            )
+
+    def _check_job_result(self, job: spool.Job, result: Dict[str, Any]) -> None:
+        logger.info("job %s finished on %s: %s", job.id, result["worker"], result)
+        if result["error"] is not None:
+            raise RemoteError(
+                "Failed to execute job {}: {}".format(job.id, result["error"])
+            )
+        execution = result["metrics"] or {}
+        exceeded = execution.get("limit_exceeded")
+        if exceeded is not None:
+            raise ExecutionFailed(
+                "Exceeded {} limit executing job {}".format(exceeded, job.id),
+                result["returncode"],
+                execution.get("stderr_tail"),
+            )
+        if result["returncode"] != 0:
+            raise ExecutionFailed(
+                "Failed to execute job {}".format(job.id),
+                result["returncode"],
+                execution.get("stderr_tail"),
+            )
+
+    def _submit_to_spool(self, spool_dir: str, job: spool.Job) -> None:
+        spool.submit(Path(spool_dir), job)
+        self.annex.info("submitted job {} to spool {}".format(job.id, spool_dir))
+        try:
+            result = spool.wait(
+                Path(spool_dir),
+                job,
+                timeout=config.get_float("spool-timeout", DEFAULT_SPOOL_TIMEOUT),
+            )
+        except spool.SpoolTimeoutError as e:
+            raise RemoteError(str(e)) from e
+        self._check_job_result(job, result)
+
+    def _delegate_to_daemon(self, job: spool.Job) -> None:
+        self.annex.info("delegating job {} to the getexec daemon".format(job.id))
+        try:
+            result = daemon.request(job, config.runtime_dir())
+        except (OSError, daemon.DaemonError) as e:
+            raise RemoteError("Failed to delegate to daemon: {}".format(e)) from e
+        self._check_job_result(job, result)
+
+    def _dispatch(self, spec: Spec, job: spool.Job) -> None:
+        spool_dir = config.get("spool-dir")
+        if spool_dir is not None:
+            self._submit_to_spool(spool_dir, job)
+        elif config.get_bool("daemon"):
+            self._delegate_to_daemon(job)
+        else:
+            self._execute_spec(spec, job.filename, job.key)
 
-    def _handle_url(self, url: str, filename: str) -> None:
-        import datalad.api as da
-        from datalad.utils import swallow_outputs
+    def _dispatch_remembering_failure(self, spec: Spec, job: spool.Job) -> None:
+        """Dispatch a job unless its recipe is known to fail with the current
+        inputs, recording the outcome for the next time."""
+        if spec.checkpoint:
+            # another attempt continues where the last one stopped
+            self._dispatch(spec, job)
+            return
+        cache = failures.FailureCache.for_dataset()
+        id = failures.failure_id(spec)
+        ttl = config.get_float("failure-ttl", 3600.0)
+        if ttl and not config.get_bool("force"):
+            failure = cache.get(id, ttl)
+            if failure is not None:
+                raise RemoteError(
+                    _with_tail(
+                        "Not executing a recipe that failed {:.0f}s ago with "
+                        "the same inputs, with exit status {}: {}; set "
+                        "DATALAD_GETEXEC_FORCE=1 to execute it anyway".format(
+                            time.time() - failure["time"],
+                            failure["returncode"],
+                            failure["reason"],
+                        ),
+                        failure["stderr_tail"],
+                    )
+                )
+        try:
+            self._dispatch(spec, job)
+        except ExecutionFailed as e:
+            cache.record(id, e.returncode, e.reason, e.stderr_tail)
+            raise
+        cache.forget(id)
 
+    def _handle_url(self, key: str, url: str, filename: str) -> None:
         spec = Spec.from_url(url)
-        inputs = spec.inputs
-        if inputs:
-            with swallow_outputs() as cm:
-                logger.info("fetching inputs: %s", inputs)
-                da.get(set(inputs))
-                logger.info("datalad get output: %s", cm.out)
-        cmd = spec.cmd
-        cmd.append(filename)
-        self._execute_cmd(cmd)
+        job = spool.Job(
+            url=url,
+            key=key,
+            filename=os.path.abspath(filename),
+            cwd=os.getcwd(),
+            env=spool.job_env(
+                os.environ, (config.get("job-env") or "").replace(",", " ").split()
+            ),
+        )
+        if not config.get_bool("single-flight", True):
+            self._dispatch_remembering_failure(spec, job)
+            return
+        with singleflight.single_flight(
+            config.runtime_dir() / "singleflight",
+            singleflight.flight_id(spec.fingerprint(), key),
+            filename,
+        ) as execute:
+            if execute:
+                self._dispatch_remembering_failure(spec, job)
+            else:
+                self.annex.info("reused output of a concurrent execution")
+
+    def _rank(self, urls: List[str]) -> List[str]:
+        """Order alternative recipes for a key by their estimated cost."""
+        store = metrics.MetricsStore.for_dataset()
+        recorded = store.load()
+        estimates = []
+        for url in urls:
+            try:
+                cost, reason = metrics.estimate(Spec.from_url(url), recorded)
+            except ValueError:
+                cost, reason = None, "unsupported URL"
+            estimates.append((cost, reason, url))
+        # recipes never executed go last, in the order git-annex gave them
+        ranked = sorted(
+            estimates, key=lambda e: (e[0] is None, e[0] if e[0] is not None else 0)
+        )
+        cost, reason, url = ranked[0]
+        logger.info("trying recipe %s first: %s", url, reason)
+        return [url for _, _, url in ranked]
+
+    def _retrieve_hedged(self, key: str, urls: List[str], filename: str) -> bool:
+        """Execute several recipes for a key at once, keeping the first result
+        matching the key and cancelling the others."""
+        self.annex.info("racing {} recipes".format(len(urls)))
+        cancel = threading.Event()
+        lock = threading.Lock()
+        finished: "queue.Queue[bool]" = queue.Queue()
+
+        def attempt(i: int, url: str) -> None:
+            tmp = "{}.hedge{}".format(filename, i)
+            ok = False
+            try:
+                result = self.executor.run(Spec.from_url(url), tmp, cancel=cancel)
+                ok = (
+                    result.returncode == 0
+                    and result.limit_exceeded is None
+                    and keys.verify(key, tmp)
+                )
+            except Exception as e:
+                logger.info("hedged recipe %s failed: %s", url, e)
+            with lock:
+                won = ok and not cancel.is_set()
+                if won:
+                    cancel.set()
+                    os.replace(tmp, filename)
+                    logger.info("hedged recipe %s finished first", url)
+                else:
+                    process.remove_output(tmp)
+            finished.put(won)
+
+        for i, url in enumerate(urls):
+            threading.Thread(target=attempt, args=(i, url), daemon=True).start()
+        # the others are cancelled, but servers and python functions can not
+        # be interrupted; they are not waited for
+        return any(finished.get() for _ in urls)
+
+    def _executable(self, urls: List[str]) -> Tuple[List[str], List[str]]:
+        """Split recipes into those passing the preflight and the reasons
+        why the others do not."""
+        passing = []
+        reasons = []
+        for url in urls:
+            try:
+                reason = self.preflight.check(Spec.from_url(url))
+            except ValueError:
+                reason = "unsupported URL"
+            if reason is None:
+                passing.append(url)
+            else:
+                reasons.append(reason)
+        return passing, reasons
 
     def transfer_retrieve(self, key: str, filename: str) -> None:
         logger.debug(
@@ -62,9 +351,26 @@ class GetExecRemote(SpecialRemote):
         )
         urls = self.annex.geturls(key, "getexec:")
         logger.debug("urls for this key: %s", urls)
+        urls, reasons = self._executable(urls)
+        if not urls:
+            raise RemoteError(
+                "No recipe for key {} can be executed here: {}".format(
+                    key, "; ".join(reasons) or "none registered"
+                )
+            )
+        if len(urls) > 1:
+            urls = self._rank(urls)
+        hedge = config.get_int("hedge") or 1
+        if hedge > 1 and len(urls) > 1:
+            if config.get("spool-dir") is not None or config.get_bool("daemon"):
+                logger.debug("not hedging, executions are delegated")
+            elif self._retrieve_hedged(key, urls[:hedge], filename):
+                return
+            else:
+                urls = urls[hedge:]
         for url in urls:
             try:
-                self._handle_url(url, filename)
+                self._handle_url(key, url, filename)
                 break
             except HandleUrlError:
                 pass
@@ -72,7 +378,17 @@ class GetExecRemote(SpecialRemote):
             raise RemoteError("Failed to handle key {}".format(key))
 
     def checkpresent(self, key: str) -> bool:
-        # We just assume that we can always handle the key
+        urls = self.annex.geturls(key, "getexec:")
+        if not urls:
+            return False
+        passing, reasons = self._executable(urls)
+        if not passing:
+            # not being able to compute it here does not mean it is gone,
+            # git-annex would record that for every clone; rather leave it
+            # unknown, so that nothing counts on it for now
+            raise RemoteError(
+                "Can not compute key {} here: {}".format(key, "; ".join(reasons))
+            )
         return True
 
     def claimurl(self, url: str) -> bool:
@@ -82,9 +398,29 @@ class GetExecRemote(SpecialRemote):
         return url.startswith("getexec:")
 
 
+def _forget_git_dir() -> None:
+    # git-annex runs us in the root of the work tree with GIT_DIR and
+    # GIT_WORK_TREE pointing at it, which would also apply to git calls in
+    # subdatasets, e.g. when fetching inputs from them; git finds the
+    # repository from the working directory just as well
+    work_tree = os.environ.get("GIT_WORK_TREE")
+    if work_tree is not None and os.path.abspath(work_tree) == os.getcwd():
+        del os.environ["GIT_WORK_TREE"]
+        os.environ.pop("GIT_DIR", None)
+
+
 def main() -> None:
+    _forget_git_dir()
     master = Master()
     remote = GetExecRemote(master)
     master.LinkRemote(remote)
     logger.addHandler(master.LoggingHandler())
-    master.Listen()
+    # git-annex being interrupted or cancelling the transfer must not leave
+    # the command running
+    grace = config.get_float("kill-grace") or 5.0
+    process.install_signal_handlers(grace)
+    try:
+        master.Listen()
+    finally:
+        process.terminate_all(grace)
+        remote.executor.close()
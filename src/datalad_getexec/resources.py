@@ -0,0 +1,104 @@
+"""Machine-wide accounting of resources used by executions
+
+Much like the jobserver of make, all executions on a machine draw from a
+common pool of tokens before they start, no matter which process runs them.
+The pool is a small state file in the runtime directory, listing the
+resources held by every running execution. Allocations of processes which
+no longer exist are discarded, so a killed process can not leak tokens.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from datalad_getexec import config
+from datalad_getexec.utils import locked_json, pid_alive
+
+logger = logging.getLogger("datalad.getexec.resources")
+
+
+class AcquireCancelled(Exception):
+    pass
+
+
+def capacities(names: Iterable[str]) -> Dict[str, Optional[int]]:
+    """Configured capacity of the given resources, None meaning unlimited."""
+    result: Dict[str, Optional[int]] = {}
+    for name in names:
+        if name == "cpus":
+            result[name] = config.get_int("cpus", os.cpu_count())
+        elif name == "memory":
+            result[name] = config.get_int(
+                "memory",
+                os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2**20,
+            )
+        else:
+            result[name] = config.get_int("resource." + name)
+            if result[name] is None:
+                logger.warning(
+                    "no capacity configured for resource %s, not limiting it", name
+                )
+    return result
+
+
+class ResourcePool:
+    def __init__(self, directory: Path) -> None:
+        self._state = directory / "resources.json"
+
+    @contextmanager
+    def _locked_state(self) -> Iterator[Dict[str, Any]]:
+        with locked_json(self._state) as state:
+            for id in [id for id, a in state.items() if not pid_alive(a["pid"])]:
+                logger.debug("discarding allocation of dead process %s", id)
+                del state[id]
+            yield state
+
+    def _try_acquire(
+        self, id: str, needs: Dict[str, int], capacities: Dict[str, Optional[int]]
+    ) -> bool:
+        with self._locked_state() as state:
+            for name, amount in needs.items():
+                capacity = capacities.get(name)
+                if capacity is None:
+                    continue
+                used = sum(a["needs"].get(name, 0) for a in state.values())
+                # something needing more than there is at all has to be able
+                # to run on its own eventually
+                if used > 0 and used + min(amount, capacity) > capacity:
+                    return False
+            state[id] = {"pid": os.getpid(), "needs": needs}
+            return True
+
+    @contextmanager
+    def acquire(
+        self,
+        needs: Dict[str, int],
+        capacities: Dict[str, Optional[int]],
+        poll_interval: float = 0.1,
+        cancel: Optional[threading.Event] = None,
+    ) -> Iterator[None]:
+        id = "{}-{}-{}".format(os.getpid(), threading.get_ident(), uuid.uuid4())
+        delay = poll_interval
+        start = time.monotonic()
+        while not self._try_acquire(id, needs, capacities):
+            if cancel is not None and cancel.wait(delay):
+                raise AcquireCancelled("cancelled while waiting for resources")
+            if cancel is None:
+                time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+        if time.monotonic() - start > poll_interval:
+            logger.info(
+                "waited %.1fs for resources %s", time.monotonic() - start, needs
+            )
+        try:
+            yield
+        finally:
+            with self._locked_state() as state:
+                state.pop(id, None)
@@ -0,0 +1,208 @@
+"""Long-running commands serving many retrievals
+
+Commands registered as servers are started once and kept running across
+retrievals, similar to git-annex' own --batch mode. For every retrieval a
+request line is written to the command's stdin, consisting of the per-output
+arguments and the target path separated by tabs. The command creates the
+target and answers with a single line on stdout, either "DONE" or "ERROR"
+followed by an optional message. Anything else the command wants to output
+needs to go to stderr.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from datalad_getexec import process
+from datalad_getexec.execution import ExecutionError, ExecutionResult
+
+logger = logging.getLogger("datalad.getexec.server")
+
+_ServerId = Tuple[Tuple[str, ...], Optional[str], Tuple[Tuple[str, str], ...]]
+
+
+class ServerError(ExecutionError):
+    pass
+
+
+def _server_id(
+    cmd: List[str], cwd: Optional[str], env: Optional[Dict[str, str]]
+) -> _ServerId:
+    # servers are only shared by requests with the same environment
+    return (tuple(cmd), cwd, tuple(sorted((env or {}).items())))
+
+
+def _cpu_time(pid: int) -> float:
+    # the server is still running, so wait4 can not tell us its resource
+    # usage; fall back to no information where /proc is not available
+    try:
+        with open("/proc/{}/stat".format(pid)) as f:
+            stat = f.read().rpartition(")")[2].split()
+    except OSError:
+        return 0.0
+    return (int(stat[11]) + int(stat[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class ServerProcess:
+    def __init__(
+        self,
+        cmd: List[str],
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+    ) -> None:
+        logger.debug("starting server %s", cmd)
+        self.cmd = cmd
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            cwd=cwd,
+            env=env,
+            encoding="utf-8",
+            bufsize=1,
+            start_new_session=True,
+        )
+        process.register_group(self.proc.pid)
+        self.jobs = 0
+        self.lock = threading.Lock()
+
+    def request(self, args: List[str], target: str) -> ExecutionResult:
+        assert self.proc.stdin is not None and self.proc.stdout is not None
+        line = "\t".join(args + [target])
+        if "\n" in line:
+            raise ServerError("request must not contain newlines: {!r}".format(line))
+        with self.lock:
+            self.jobs += 1
+            start = time.monotonic()
+            cpu_start = _cpu_time(self.proc.pid)
+            try:
+                self.proc.stdin.write(line + "\n")
+                self.proc.stdin.flush()
+                reply = self.proc.stdout.readline()
+            except (BrokenPipeError, ValueError):
+                # ValueError: the server has been closed in the meantime
+                reply = ""
+            duration = time.monotonic() - start
+            cpu_time = _cpu_time(self.proc.pid) - cpu_start
+        if not reply:
+            raise ServerError(
+                "server {} exited with {}".format(self.cmd, self.proc.wait())
+            )
+        reply = reply.rstrip("\n")
+        if reply != "DONE":
+            logger.info("server %s replied %r to %r", self.cmd, reply, line)
+        return ExecutionResult(
+            returncode=0 if reply == "DONE" else 1,
+            duration=duration,
+            cpu_time=cpu_time,
+            max_rss=0,
+        )
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def close(self, timeout: float = 10) -> None:
+        logger.debug("stopping server %s after %d jobs", self.cmd, self.jobs)
+        with self.lock:
+            if self.proc.stdin is not None:
+                try:
+                    self.proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+            try:
+                self.proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                pass
+            process.terminate_group(self.proc.pid)
+            process.unregister_group(self.proc.pid)
+            self.proc.wait()
+
+
+class ServerPool:
+    """Keeps server processes alive between requests.
+
+    A server is recycled after it has handled ``max_jobs`` requests, and
+    stopped once it has been idle for ``idle_timeout`` seconds.
+    """
+
+    def __init__(
+        self, max_jobs: Optional[int] = None, idle_timeout: Optional[float] = None
+    ) -> None:
+        self.max_jobs = max_jobs
+        self.idle_timeout = idle_timeout
+        self._servers: Dict[_ServerId, ServerProcess] = {}
+        self._timers: Dict[_ServerId, threading.Timer] = {}
+        self._lock = threading.Lock()
+
+    def _get(
+        self, cmd: List[str], cwd: Optional[str], env: Optional[Dict[str, str]]
+    ) -> ServerProcess:
+        id = _server_id(cmd, cwd, env)
+        with self._lock:
+            timer = self._timers.pop(id, None)
+            if timer is not None:
+                timer.cancel()
+            server = self._servers.get(id)
+            if server is None or not server.alive():
+                server = self._servers[id] = ServerProcess(cmd, cwd, env)
+            return server
+
+    def _release(
+        self, cmd: List[str], cwd: Optional[str], env: Optional[Dict[str, str]]
+    ) -> None:
+        id = _server_id(cmd, cwd, env)
+        with self._lock:
+            server = self._servers.get(id)
+            if server is None:
+                return
+            timer = self._timers.pop(id, None)
+            if timer is not None:
+                timer.cancel()
+            if self.max_jobs is not None and server.jobs >= self.max_jobs:
+                del self._servers[id]
+            else:
+                if self.idle_timeout is not None:
+                    timer = threading.Timer(self.idle_timeout, self._expire, (id,))
+                    timer.daemon = True
+                    self._timers[id] = timer
+                    timer.start()
+                return
+        # closing waits for requests still in flight on this server, so it
+        # must not happen while holding the pool lock
+        server.close()
+
+    def _expire(self, id: _ServerId) -> None:
+        with self._lock:
+            self._timers.pop(id, None)
+            server = self._servers.pop(id, None)
+        if server is not None:
+            server.close()
+
+    def request(
+        self,
+        cmd: List[str],
+        args: List[str],
+        target: str,
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+    ) -> ExecutionResult:
+        server = self._get(cmd, cwd, env)
+        try:
+            return server.request(args, target)
+        finally:
+            self._release(cmd, cwd, env)
+
+    def close(self) -> None:
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            servers = list(self._servers.values())
+            self._timers.clear()
+            self._servers.clear()
+        for server in servers:
+            server.close()
@@ -0,0 +1,119 @@
+"""Cross-process deduplication of identical executions
+
+Processes about to execute the same spec for the same key serialize on a lock
+file in the runtime directory. The first one executes. If others have queued
+up behind it in the meantime, it publishes its output for them before
+releasing the lock, so that they copy it instead of executing the command
+again. The last of them removes the published output.
+
+Lock files are removed once nobody waits for them anymore, and so are
+outputs published for waiters which died before picking them up.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from datalad_getexec.utils import locked_file, pid_alive
+
+logger = logging.getLogger("datalad.getexec.singleflight")
+
+
+def flight_id(fingerprint: str, key: str) -> str:
+    return hashlib.sha256("{}\0{}".format(fingerprint, key).encode("utf-8")).hexdigest()
+
+
+def _waiting(directory: Path, id: str) -> bool:
+    waiting = False
+    for marker in directory.glob(id + ".wait.*"):
+        pid = int(marker.name.split(".")[2])
+        if pid_alive(pid):
+            waiting = True
+        else:
+            marker.unlink(missing_ok=True)
+    return waiting
+
+
+def _published(directory: Path, id: str) -> Optional[Path]:
+    try:
+        return Path((directory / (id + ".out")).read_text())
+    except FileNotFoundError:
+        return None
+
+
+def _unpublish(directory: Path, id: str, published: Path) -> None:
+    published.unlink(missing_ok=True)
+    (directory / (id + ".out")).unlink(missing_ok=True)
+
+
+def _publish(directory: Path, id: str, filename: str) -> None:
+    # a hard link next to the output survives git-annex moving the output
+    # into the object store after we return
+    link = Path(filename + ".singleflight")
+    link.unlink(missing_ok=True)
+    try:
+        os.link(filename, link)
+    except OSError as e:
+        logger.debug("copying output for waiters, could not link it: %s", e)
+        shutil.copyfile(filename, link)
+    (directory / (id + ".out")).write_text(str(link.absolute()))
+
+
+def _sweep(directory: Path) -> None:
+    """Remove lock files and published outputs nobody waits for."""
+    for lock in directory.glob("*.lock"):
+        id = lock.name[: -len(".lock")]
+        with locked_file(lock, blocking=False) as taken:
+            if not taken or _waiting(directory, id):
+                continue
+            published = _published(directory, id)
+            if published is not None:
+                logger.debug("removing output published for %s", id)
+                _unpublish(directory, id, published)
+            lock.unlink()
+
+
+@contextmanager
+def single_flight(directory: Path, id: str, filename: str) -> Iterator[bool]:
+    """Execute only once for concurrent callers with the same id.
+
+    Yields True if the caller has to execute and write its output to
+    ``filename``, or False if the output of a concurrent execution has
+    already been copied there.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    marker = directory / "{}.wait.{}.{}".format(id, os.getpid(), threading.get_ident())
+    marker.touch()
+    lock = directory / (id + ".lock")
+    try:
+        with locked_file(lock):
+            marker.unlink()
+            published = _published(directory, id)
+            if published is not None:
+                try:
+                    shutil.copyfile(published, filename)
+                except OSError as e:
+                    logger.debug("could not reuse %s: %s", published, e)
+                    _unpublish(directory, id, published)
+                else:
+                    logger.info("reusing output of concurrent execution")
+                    if not _waiting(directory, id):
+                        _unpublish(directory, id, published)
+                        lock.unlink()
+                    yield False
+                    return
+            yield True
+            if _waiting(directory, id):
+                _publish(directory, id, filename)
+            else:
+                lock.unlink()
+    finally:
+        marker.unlink(missing_ok=True)
+        _sweep(directory)
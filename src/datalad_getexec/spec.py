@@ -1,9 +1,10 @@
 from __future__ import annotations
 
 import base64
+import hashlib
 import json
 import urllib.parse
-from dataclasses import asdict, dataclass
+from dataclasses import MISSING, asdict, dataclass, fields
 from typing import Any, Dict, List, Optional
 
 from datalad_getexec import compat
@@ -13,6 +14,54 @@ from datalad_getexec import compat
 class Spec:
     cmd: List[str]
     inputs: Optional[List[str]]
+    # "module:function" to call in a python worker instead of executing cmd,
+    # cmd then holds the arguments passed to the function
+    python: Optional[str] = None
+    # arguments specific to this output, passed after cmd; for servers they
+    # are sent with each request instead of being part of the server command
+    args: Optional[List[str]] = None
+    # cmd is a long-running server, see datalad_getexec.server
+    server: bool = False
+    # resources taken from the machine-wide pool while executing, memory is
+    # in MiB, see datalad_getexec.resources
+    cpus: Optional[int] = None
+    memory: Optional[int] = None
+    resources: Optional[Dict[str, int]] = None
+    # scheduling priority for background materialization
+    nice: Optional[int] = None
+    ionice: Optional[str] = None
+    # limits enforced on the command, in seconds and MiB respectively, see
+    # datalad_getexec.limits
+    timeout: Optional[int] = None
+    cpu_limit: Optional[int] = None
+    memory_limit: Optional[int] = None
+    # the output is what cmd writes to stdout, instead of the file named by
+    # the path appended to it
+    stdout: bool = False
+    # commands whose stdout is piped into the next one, the last of them into
+    # cmd, see datalad_getexec.execution.run_pipeline
+    pipeline: Optional[List[List[str]]] = None
+    # working directory relative to the dataset root
+    cwd: Optional[str] = None
+    # environment variables set for the command, and the names (or fnmatch
+    # patterns) of the variables passed on from the caller's environment;
+    # without env_allow the command inherits the whole environment
+    env: Optional[Dict[str, str]] = None
+    env_allow: Optional[List[str]] = None
+    # paths of the files written by a command producing several outputs,
+    # relative to the directory it gets instead of an output path, and the
+    # one of them this spec retrieves, see datalad_getexec.staging
+    outputs: Optional[List[str]] = None
+    output: Optional[str] = None
+    # cmd accepts the args and target of many specs in one call, see
+    # datalad_getexec.materialize
+    batch: bool = False
+    # cmd gets a directory kept across failed attempts to save its progress
+    # in, see datalad_getexec.execution.checkpoint_dir
+    checkpoint: bool = False
+    # git glob patterns (see gitglossary) for further inputs, expanded when
+    # they are needed, see datalad_getexec.inputs
+    input_globs: Optional[List[str]] = None
 
     @classmethod
     def from_dict(cls, dict: Dict[str, Any]) -> Spec:
@@ -35,12 +84,27 @@ class Spec:
             return spec
         raise ValueError("unsupported URL value encountered")
 
+    def command(self, filename: str) -> List[str]:
+        """The full command line for producing ``filename``."""
+        return self.cmd + (self.args or []) + ([] if self.stdout else [filename])
+
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
+        # optional fields are left out while they have their default value,
+        # so that URLs of specs not using them stay short and unchanged
+        defaults = {f.name: f.default for f in fields(self) if f.default is not MISSING}
+        return {
+            k: v
+            for k, v in asdict(self).items()
+            if k not in defaults or v != defaults[k]
+        }
 
     def to_json(self) -> str:
         return json.dumps(self.to_dict(), separators=(",", ":"))
 
+    def fingerprint(self) -> str:
+        canonical = json.dumps(self.to_dict(), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
     def to_url(self) -> str:
         json_spec = self.to_json()
         url = "getexec:v1-" + urllib.parse.quote(
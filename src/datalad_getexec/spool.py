@@ -0,0 +1,209 @@
+"""Job spool on a shared filesystem
+
+A spool is a directory with the subdirectories ``new``, ``claimed`` and
+``done``. The special remote submits a job by atomically placing a job file in
+``new``. A worker claims it by renaming it into ``claimed``, which only one
+worker can succeed at, executes it and places the result under the same name
+in ``done``, where the submitter picks it up.
+
+A claimed job is leased to its worker, which records its host and pid next to
+it and renews the lease by touching the job file while executing it. Workers
+looking for jobs put those back into ``new`` whose lease has not been renewed
+for ``datalad.getexec.spool-lease`` seconds, or whose worker is known to be
+dead, so that jobs of crashed workers are executed by others.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Mapping, Optional
+
+from datalad_getexec.utils import load_json, pid_alive
+
+logger = logging.getLogger("datalad.getexec.spool")
+
+SUBDIRS = ("tmp", "new", "claimed", "done")
+
+DEFAULT_LEASE = 300.0
+
+# variables of the submitter passed on with jobs, those configuring getexec
+# and those selecting the software to execute commands with; everything
+# else, in particular credentials, stays behind
+JOB_ENV = (
+    "DATALAD_GETEXEC_*",
+    "PATH",
+    "PYTHONPATH",
+    "VIRTUAL_ENV",
+    "CONDA_PREFIX",
+    "CONDA_DEFAULT_ENV",
+    "LANG",
+    "LC_*",
+)
+
+
+def job_env(environ: Mapping[str, str], allow: Iterable[str] = ()) -> Dict[str, str]:
+    """The variables of ``environ`` to pass on with a job, those matching
+    JOB_ENV or one of the patterns in ``allow``."""
+    patterns = JOB_ENV + tuple(allow)
+    return {
+        name: value
+        for name, value in environ.items()
+        if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+    }
+
+
+class SpoolTimeoutError(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    url: str
+    key: str
+    filename: str
+    cwd: str
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    # variables of the submitting process, see job_env; configuration is
+    # looked up in them, and commands are executed with them
+    env: Optional[Dict[str, str]] = None
+
+    @classmethod
+    def from_dict(cls, dict: Dict[str, Any]) -> Job:
+        return cls(**dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def ensure_spool(spool: Path) -> None:
+    for subdir in SUBDIRS:
+        (spool / subdir).mkdir(parents=True, exist_ok=True)
+
+
+def _write_atomically(spool: Path, target: Path, content: Dict[str, Any]) -> None:
+    # write to the spool-local tmp dir first, so that a reader never sees a
+    # partially written file; rename is atomic within a filesystem. Only
+    # we may read jobs, they contain part of our environment
+    tmp = spool / "tmp" / "{}.{}".format(socket.gethostname(), uuid.uuid4())
+    with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as f:
+        f.write(json.dumps(content))
+    os.replace(tmp, target)
+
+
+def submit(spool: Path, job: Job) -> None:
+    ensure_spool(spool)
+    _write_atomically(spool, spool / "new" / (job.id + ".json"), job.to_dict())
+    logger.debug("submitted job %s to %s", job.id, spool)
+
+
+def wait(
+    spool: Path,
+    job: Job,
+    timeout: Optional[float] = None,
+    poll_interval: float = 0.5,
+) -> Dict[str, Any]:
+    """Wait until a worker has finished the job and return its result."""
+    done = spool / "done" / (job.id + ".json")
+    start = time.monotonic()
+    while not done.exists():
+        if timeout is not None and time.monotonic() - start > timeout:
+            # withdraw the job if no worker has claimed it yet
+            (spool / "new" / (job.id + ".json")).unlink(missing_ok=True)
+            raise SpoolTimeoutError(
+                "job {} was not finished within {}s".format(job.id, timeout)
+            )
+        time.sleep(poll_interval)
+    result: Dict[str, Any] = json.loads(done.read_text())
+    done.unlink()
+    return result
+
+
+def _expired(claimed: Path, lease: float) -> bool:
+    worker = load_json(claimed.with_suffix(".worker"))
+    if worker.get("host") == socket.gethostname() and not pid_alive(worker["pid"]):
+        return True
+    return time.time() - claimed.stat().st_mtime > lease
+
+
+def requeue(spool: Path, lease: float = DEFAULT_LEASE) -> None:
+    """Put claimed jobs whose lease expired back into ``new``."""
+    for claimed in (spool / "claimed").glob("*.json"):
+        try:
+            if not _expired(claimed, lease):
+                continue
+            claimed.with_suffix(".worker").unlink(missing_ok=True)
+            os.rename(claimed, spool / "new" / claimed.name)
+        except FileNotFoundError:
+            # finished or requeued by someone else in the meantime
+            continue
+        logger.info("requeued job %s of a dead worker", claimed.stem)
+
+
+def claim(spool: Path, lease: float = DEFAULT_LEASE) -> Iterator[Job]:
+    """Claim pending jobs, oldest first.
+
+    Jobs claimed by another worker in the meantime are skipped. Jobs of dead
+    workers are pending again.
+    """
+    ensure_spool(spool)
+    requeue(spool, lease)
+    pending = []
+    for path in (spool / "new").iterdir():
+        try:
+            pending.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            continue
+    for _, path in sorted(pending):
+        claimed = spool / "claimed" / path.name
+        try:
+            # the lease starts now, not when the job was submitted
+            os.utime(path)
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            continue
+        _write_atomically(
+            spool,
+            claimed.with_suffix(".worker"),
+            {"host": socket.gethostname(), "pid": os.getpid()},
+        )
+        yield Job.from_dict(json.loads(claimed.read_text()))
+
+
+@contextmanager
+def leased(spool: Path, job: Job, lease: float = DEFAULT_LEASE) -> Iterator[None]:
+    """Keep renewing the lease on a claimed job."""
+    claimed = spool / "claimed" / (job.id + ".json")
+    stop = threading.Event()
+
+    def renew() -> None:
+        while not stop.wait(lease / 3):
+            try:
+                os.utime(claimed)
+            except FileNotFoundError:
+                logger.warning("job %s was taken away from us", job.id)
+                return
+
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def finish(spool: Path, job: Job, result: Dict[str, Any]) -> None:
+    _write_atomically(spool, spool / "done" / (job.id + ".json"), result)
+    claimed = spool / "claimed" / (job.id + ".json")
+    claimed.unlink(missing_ok=True)
+    claimed.with_suffix(".worker").unlink(missing_ok=True)
@@ -0,0 +1,112 @@
+"""Staging of the outputs of multi-output recipes
+
+A recipe with several outputs is registered once per output, but executed
+only once for all of them: the first retrieval executes the command into a
+directory below ``.git/getexec/staged``, takes its own output from there and
+leaves the others staged. Retrievals of the sibling outputs then just take
+theirs, git-annex verifies them against their keys like any other content.
+
+Staged outputs are kept per recipe and state of its inputs, so that outputs
+of a recipe whose inputs changed since are not taken. Those not taken within
+``datalad.getexec.staged-ttl`` seconds (a day by default, 0 keeps them) are
+removed, as are all of them by getexec-gc.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import logging
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from datalad_getexec import config, inputs
+from datalad_getexec.spec import Spec
+from datalad_getexec.utils import locked_file
+
+logger = logging.getLogger("datalad.getexec.staging")
+
+
+def recipe_id(spec: Spec) -> str:
+    """Fingerprint of a spec, common to all of its outputs."""
+    return dataclasses.replace(spec, output=None).fingerprint()
+
+
+def stage_id(spec: Spec, cwd: Optional[str] = None) -> str:
+    """Identifier of the outputs of one execution of a recipe, with its
+    inputs in their current state."""
+    return hashlib.sha256(
+        "{}\0{}".format(recipe_id(spec), inputs.state(spec, cwd)).encode("utf-8")
+    ).hexdigest()
+
+
+def staging_dir(cwd: Optional[str] = None) -> Path:
+    return config.dataset_dir(cwd) / "staged"
+
+
+@contextmanager
+def locked(directory: Path, id: str) -> Iterator[Path]:
+    """Lock the staged outputs of a recipe, yielding their directory."""
+    directory.mkdir(parents=True, exist_ok=True)
+    with locked_file(directory / (id + ".lock")):
+        yield directory / id
+
+
+def size(path: Path) -> int:
+    """Bytes taken by the files below path."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def expire(directory: Path, ttl: float) -> int:
+    """Remove outputs staged more than ``ttl`` seconds ago, along with those
+    of executions that were interrupted, returning the bytes freed. Outputs
+    in use are kept."""
+    freed = 0
+    now = time.time()
+    for lock in directory.glob("*.lock"):
+        staged = directory / lock.name[: -len(".lock")]
+        with locked_file(lock, blocking=False) as taken:
+            if not taken:
+                continue
+            try:
+                if now - staged.stat().st_mtime < ttl:
+                    continue
+            except FileNotFoundError:
+                pass
+            for path in (staged, staged.with_name(staged.name + ".tmp")):
+                freed += size(path)
+                shutil.rmtree(path, ignore_errors=True)
+            lock.unlink()
+    if freed:
+        logger.info("removed %d bytes of staged outputs", freed)
+    return freed
+
+
+def take(staged: Path, output: str, filename: str) -> bool:
+    """Move a staged output to ``filename``, False if it is not staged."""
+    source = staged / output
+    if not source.is_file():
+        return False
+    shutil.move(str(source), filename)
+    # remove what has been emptied by this, including the staged directory
+    parent = source.parent
+    while True:
+        try:
+            parent.rmdir()
+        except OSError:
+            break
+        if parent == staged:
+            break
+        parent = parent.parent
+    return True
@@ -0,0 +1,56 @@
+"""Inputs fetched only for the duration of an execution
+
+With ``datalad.getexec.transient-inputs`` enabled, inputs that are missing
+when an execution needs them are dropped again once it is done, so that
+retrieving a few derived files does not leave all of their raw inputs
+behind. Inputs that were present before are never dropped.
+
+Concurrent executions sharing an input count their references to it in
+``.git/getexec/transient.json``, and only the last of them drops it. A
+reference left by an execution that was killed keeps the input from being
+dropped, which errs on the safe side.
+"""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from datalad_getexec import config
+from datalad_getexec.utils import locked_json
+
+logger = logging.getLogger("datalad.getexec.transient")
+
+
+class TransientInputs:
+    def __init__(self, directory: Path) -> None:
+        self._path = directory / "transient.json"
+
+    @classmethod
+    def for_dataset(cls, cwd: Optional[str] = None) -> TransientInputs:
+        return cls(config.dataset_dir(cwd))
+
+    def acquire(self, inputs: List[str], missing: List[str]) -> List[str]:
+        """Count a reference to each of the inputs that is missing or held by
+        another execution, returning those."""
+        with locked_json(self._path) as refs:
+            held = [path for path in inputs if path in missing or refs.get(path)]
+            for path in held:
+                refs[path] = refs.get(path, 0) + 1
+        return held
+
+    def release(self, paths: List[str], drop: Callable[[List[str]], None]) -> None:
+        """Release references taken with acquire, dropping the inputs no
+        execution holds anymore."""
+        with locked_json(self._path) as refs:
+            unused = []
+            for path in paths:
+                refs[path] = refs.get(path, 0) - 1
+                if refs[path] <= 0:
+                    del refs[path]
+                    unused.append(path)
+            # while still holding the lock, so nobody starts counting on them
+            # in the meantime
+            if unused:
+                drop(unused)
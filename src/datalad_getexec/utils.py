@@ -0,0 +1,69 @@
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists, but belongs to someone else
+        pass
+    return True
+
+
+def load_json(path: Path) -> Dict[str, Any]:
+    """The content of a JSON state file, empty if it is missing or broken."""
+    try:
+        data: Dict[str, Any] = json.loads(path.read_text())
+    except (OSError, ValueError):
+        data = {}
+    return data
+
+
+@contextmanager
+def locked_file(path: Path, blocking: bool = True) -> Iterator[bool]:
+    """Hold an exclusive lock on a lock file, yielding whether it was taken,
+    which without blocking it might not be.
+
+    The holder may remove the lock file to clean up; whoever was waiting for
+    it then locks a new file at the same path instead.
+    """
+    while True:
+        lock = open(path, "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            lock.close()
+            yield False
+            return
+        try:
+            current = os.stat(path).st_ino == os.fstat(lock.fileno()).st_ino
+        except FileNotFoundError:
+            current = False
+        if current:
+            break
+        lock.close()
+    try:
+        yield True
+    finally:
+        lock.close()
+
+
+@contextmanager
+def locked_json(path: Path) -> Iterator[Dict[str, Any]]:
+    """Update a JSON state file, serialized between processes by a lock file
+    next to it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_suffix(".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        data = load_json(path)
+        yield data
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data))
+        tmp.replace(path)
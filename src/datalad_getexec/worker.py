@@ -0,0 +1,121 @@
+"""DataLad getexec-worker command"""
+
+__docformat__ = "restructuredtext"
+
+import logging
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from datalad.interface.base import Interface, build_doc, eval_results
+from datalad.interface.results import get_status_dict
+from datalad.support.constraints import EnsureFloat, EnsureNone, EnsureStr
+from datalad.support.param import Parameter
+
+from datalad_getexec import config, process, spool
+from datalad_getexec.execution import Executor, execute_job
+
+logger = logging.getLogger("datalad.getexec.worker")
+
+
+@build_doc
+class GetExecWorker(Interface):
+    """Execute getexec retrievals submitted to a spool directory
+
+    If the configuration item "datalad.getexec.spool-dir" is set, the getexec
+    special remote does not execute commands itself. Instead it places a job
+    into the given directory and waits for a worker to finish it. Workers can
+    run on any machine that sees the spool directory and the dataset under the
+    same paths, e.g. on the nodes of a cluster with a shared filesystem. Any
+    number of workers can serve the same spool.
+    """
+
+    _examples_ = [
+        dict(
+            text="Serve the spool configured for the current dataset",
+            code_py="getexec_worker()",
+            code_cmd="datalad getexec-worker",
+        ),
+        dict(
+            text="Serve a spool until it has been idle for ten minutes",
+            code_py='getexec_worker(spool="/shared/spool", idle_timeout=600)',
+            code_cmd="datalad getexec-worker --spool /shared/spool "
+            "--idle-timeout 600",
+        ),
+    ]
+
+    _params_ = dict(
+        spool=Parameter(
+            args=("--spool",),
+            metavar="PATH",
+            doc="""spool directory to take jobs from. Defaults to the value of
+            the configuration item "datalad.getexec.spool-dir".""",
+            constraints=EnsureStr() | EnsureNone(),
+        ),
+        idle_timeout=Parameter(
+            args=("--idle-timeout",),
+            metavar="SECONDS",
+            doc="""stop after no job has been available for this long. By
+            default the worker runs until it is interrupted.""",
+            constraints=EnsureFloat() | EnsureNone(),
+        ),
+        poll_interval=Parameter(
+            args=("--poll-interval",),
+            metavar="SECONDS",
+            doc="""time to wait between looking for new jobs.""",
+            constraints=EnsureFloat(),
+        ),
+    )
+
+    @staticmethod
+    @eval_results
+    def __call__(
+        spool: Optional[str] = None,
+        idle_timeout: Optional[float] = None,
+        poll_interval: float = 0.5,
+    ) -> Iterable[Dict]:
+        spool_path = spool if spool is not None else config.get("spool-dir")
+        if spool_path is None:
+            yield get_status_dict(
+                action="getexec-worker",
+                status="impossible",
+                message="no spool directory given or configured",
+            )
+            return
+        yield from _serve(Path(spool_path), idle_timeout, poll_interval)
+
+
+def _serve(
+    spool_path: Path, idle_timeout: Optional[float], poll_interval: float
+) -> Iterable[Dict]:
+    executor = Executor()
+    # like the special remote, leave nothing running behind when told to stop
+    process.install_signal_handlers(config.get_float("kill-grace") or 5.0)
+    lease = config.get_float("spool-lease") or spool.DEFAULT_LEASE
+    last_job = time.monotonic()
+    try:
+        while idle_timeout is None or time.monotonic() - last_job < idle_timeout:
+            for job in spool.claim(spool_path, lease):
+                logger.debug("claimed job %s", job.id)
+                with spool.leased(spool_path, job, lease):
+                    result = execute_job(executor, job)
+                spool.finish(spool_path, job, result)
+                last_job = time.monotonic()
+                ok = result["error"] is None and result["returncode"] == 0
+                yield get_status_dict(
+                    action="getexec-worker",
+                    path=job.filename,
+                    status="ok" if ok else "error",
+                    message=(
+                        None
+                        if ok
+                        else result["error"]
+                        or "command exited with {}".format(result["returncode"])
+                    ),
+                    key=job.key,
+                    metrics=result["metrics"],
+                )
+            time.sleep(poll_interval)
+    finally:
+        process.terminate_all()
+        executor.close()
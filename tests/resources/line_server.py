@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+
+def main() -> None:
+    for line in sys.stdin:
+        *args, target = line.rstrip("\n").split("\t")
+        if "fail" in args:
+            print("ERROR failing on purpose", flush=True)
+            continue
+        with open(target, mode="w") as f:
+            f.write(str(os.getpid()) if "pid" in args else " ".join(args))
+        print("DONE", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from datalad_getexec import config
+
+
+def test_get_reads_git_config_once(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    with (tmp_path / ".git" / "config").open("a") as f:
+        f.write('[datalad "getexec"]\n\tspool-dir = /spool\n\ttransient-inputs\n')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("DATALAD_GETEXEC_SPOOL__DIR", raising=False)
+    assert config.get("spool-dir") == "/spool"
+    assert config.get_bool("transient-inputs")
+    assert config.get("unset", "default") == "default"
+    # the environment takes precedence, changes to git config are not seen
+    monkeypatch.setenv("DATALAD_GETEXEC_SPOOL__DIR", "/other")
+    assert config.get("spool-dir") == "/other"
+    monkeypatch.delenv("DATALAD_GETEXEC_SPOOL__DIR")
+    subprocess.run(["git", "config", "datalad.getexec.spool-dir", "/new"], check=True)
+    assert config.get("spool-dir") == "/spool"
+
+
+def test_dataset_dir(tmp_path: Path) -> None:
+    with pytest.raises(subprocess.CalledProcessError):
+        config.dataset_dir(str(tmp_path))
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    assert config.dataset_dir(str(tmp_path)) == tmp_path / ".git" / "getexec"
+
+
+def test_caller_configuration(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("DATALAD_GETEXEC_KILL__GRACE", "1")
+    monkeypatch.setenv("DATALAD_GETEXEC_RUNTIME__DIR", str(tmp_path / "ours"))
+    monkeypatch.setenv("HOME", "/home/ours")
+    env = {
+        "DATALAD_GETEXEC_SPOOL__DIR": "/spool",
+        "DATALAD_GETEXEC_RUNTIME__DIR": str(tmp_path / "theirs"),
+        "PATH": "/theirs",
+    }
+    with config.caller(env, str(tmp_path)):
+        assert config.get("spool-dir") == "/spool"
+        # only what the caller sent counts
+        assert config.get("kill-grace") is None
+        # the runtime directory is machine-local
+        assert config.runtime_dir() == tmp_path / "ours"
+        assert config.environ()["PATH"] == "/theirs"
+        assert config.environ()["HOME"] == "/home/ours"
+    assert config.get("kill-grace") == "1"
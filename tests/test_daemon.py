@@ -0,0 +1,118 @@
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from datalad_getexec import daemon
+from datalad_getexec.spec import Spec
+from datalad_getexec.spool import Job
+
+
+def test_identical_jobs_in_flight_are_executed_once(tmp_path: Path) -> None:
+    server = daemon.Daemon(str(tmp_path / daemon.SOCKET_NAME), jobs=2)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    spec = Spec(
+        ["bash", "-c", 'sleep 1; echo >> count; printf "output" > "$1"', "test"],
+        None,
+    )
+    results = {}
+
+    def request(name: str) -> None:
+        job = Job(
+            url=spec.to_url(),
+            key="MD5E-s6--e2d5f8e8e2d1e1c1c3b7b7e8c4d5c0a1",
+            filename=str(tmp_path / name),
+            cwd=str(tmp_path),
+        )
+        results[name] = daemon.request(job, tmp_path)
+
+    try:
+        clients = [
+            threading.Thread(target=request, args=(name,)) for name in ("a", "b")
+        ]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+    assert all(result["returncode"] == 0 for result in results.values())
+    assert (tmp_path / "a").read_text() == (tmp_path / "b").read_text() == "output"
+    assert (tmp_path / "count").read_text() == "\n"
+    assert server.deduplicated == 1
+
+
+def test_jobs_are_executed_in_the_environment_of_the_caller(tmp_path: Path) -> None:
+    dataset = tmp_path / "dataset"
+    subprocess.run(["git", "init", "-q", str(dataset)], check=True)
+    scratch = tmp_path / "scratch"
+    subprocess.run(
+        ["git", "config", "datalad.getexec.scratch-dir", str(scratch)],
+        cwd=dataset,
+        check=True,
+    )
+    bin = tmp_path / "bin"
+    bin.mkdir()
+    (bin / "greet").write_text('#!/bin/sh\nprintf "%s" "$GREETING"\n')
+    (bin / "greet").chmod(0o755)
+    env = dict(os.environ, GREETING="hello")
+    env["PATH"] = "{}:{}".format(bin, env["PATH"])
+    server = daemon.Daemon(str(tmp_path / daemon.SOCKET_NAME))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    spec = Spec(["sh", "-c", 'greet > "$1"; echo "$1" > used', "test"], None)
+    try:
+        result = daemon.request(
+            Job(
+                url=spec.to_url(),
+                key="MD5E-s5--5d41402abc4b2a76b9719d911017c592",
+                filename=str(dataset / "output"),
+                cwd=str(dataset),
+                env=env,
+            ),
+            tmp_path,
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+    assert result["returncode"] == 0, result
+    assert (dataset / "output").read_text() == "hello"
+    assert Path((dataset / "used").read_text().strip()).parent.parent == scratch
+
+
+def test_followers_are_told_when_their_copy_fails(tmp_path: Path) -> None:
+    server = daemon.Daemon(str(tmp_path / daemon.SOCKET_NAME), jobs=2)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    spec = Spec(["bash", "-c", 'sleep 1; printf "output" > "$1"', "test"], None)
+    results = {}
+
+    def request(name: str) -> None:
+        job = Job(
+            url=spec.to_url(),
+            key="MD5E-s6--e2d5f8e8e2d1e1c1c3b7b7e8c4d5c0a1",
+            filename=str(tmp_path / name),
+            cwd=str(tmp_path),
+        )
+        results[name] = daemon.request(job, tmp_path)
+
+    try:
+        leader = threading.Thread(target=request, args=("a",))
+        leader.start()
+        time.sleep(0.3)
+        # nowhere to copy the output to
+        request("missing/b")
+        leader.join()
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+    assert results["a"]["error"] is None
+    assert (tmp_path / "a").read_text() == "output"
+    assert "could not copy output" in results["missing/b"]["error"]
+    assert results["missing/b"]["deduplicated"]
@@ -0,0 +1,173 @@
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from datalad_getexec import execution
+from datalad_getexec.execution import Executor, checkpoint_dir, run_cmd
+from datalad_getexec.spec import Spec
+
+
+def test_partial_output_is_removed_on_failure(tmp_path: Path) -> None:
+    spec = Spec(["bash", "-c", 'printf "partial" > "$1"; exit 1', "test"], None)
+    result = Executor().run(spec, str(tmp_path / "output"))
+    assert result.returncode == 1
+    assert not (tmp_path / "output").exists()
+
+
+def test_stdout_is_written_to_output(tmp_path: Path) -> None:
+    spec = Spec(["printf", "%s", "streamed"], None, stdout=True)
+    result = Executor().run(spec, "output", str(tmp_path))
+    assert result.returncode == 0
+    assert (tmp_path / "output").read_text() == "streamed"
+
+
+def test_commands_do_not_read_our_stdin(tmp_path: Path) -> None:
+    spec = Spec(["readlink", "/proc/self/fd/0"], None, stdout=True)
+    read, write = os.pipe()
+    stdin = os.dup(0)
+    os.dup2(read, 0)
+    try:
+        result = Executor().run(spec, "output", str(tmp_path))
+    finally:
+        os.dup2(stdin, 0)
+        for fd in (stdin, read, write):
+            os.close(fd)
+    assert result.returncode == 0
+    assert (tmp_path / "output").read_text().strip() == os.devnull
+
+
+def test_pipeline_connects_stages(tmp_path: Path) -> None:
+    spec = Spec(
+        ["tr", "a-z", "A-Z"],
+        None,
+        stdout=True,
+        pipeline=[["printf", "b\\na\\n"], ["sort"]],
+    )
+    result = Executor().run(spec, "output", str(tmp_path))
+    assert result.returncode == 0
+    assert (tmp_path / "output").read_text() == "A\nB\n"
+    assert result.stages is not None
+    assert [stage["returncode"] for stage in result.stages] == [0, 0, 0]
+
+
+def test_pipeline_fails_if_any_stage_fails(tmp_path: Path) -> None:
+    spec = Spec(["cat"], None, stdout=True, pipeline=[["false"]])
+    result = Executor().run(spec, "output", str(tmp_path))
+    assert result.returncode == 1
+    assert result.stages is not None
+    assert [stage["returncode"] for stage in result.stages] == [1, 0]
+    assert not (tmp_path / "output").exists()
+
+
+def test_env_and_cwd(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("GETEXEC_TEST_ALLOWED", "allowed")
+    monkeypatch.setenv("GETEXEC_TEST_REMOVED", "removed")
+    (tmp_path / "sub").mkdir()
+    spec = Spec(
+        [
+            "bash",
+            "-c",
+            'printf "%s %s %s %s" "$GETEXEC_TEST_ALLOWED" "$GETEXEC_TEST_REMOVED" '
+            '"$GETEXEC_TEST_SET" "${PWD##*/}"',
+        ],
+        None,
+        stdout=True,
+        cwd="sub",
+        env={"GETEXEC_TEST_SET": "set"},
+        env_allow=["PATH", "GETEXEC_TEST_A*"],
+    )
+    result = Executor().run(spec, "output", str(tmp_path))
+    assert result.returncode == 0
+    assert (tmp_path / "output").read_text() == "allowed  set sub"
+
+
+def test_cancel_terminates_command() -> None:
+    cancel = threading.Event()
+    threading.Timer(0.5, cancel.set).start()
+    start = time.monotonic()
+    result = run_cmd(["sleep", "30"], cancel=cancel)
+    assert result.returncode != 0
+    assert time.monotonic() - start < 10
+
+
+def test_checkpoint_survives_failed_attempts(tmp_path: Path) -> None:
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    # fails unless resuming from a first step done by an earlier attempt
+    spec = Spec(
+        [
+            "bash",
+            "-c",
+            'test "$GETEXEC_RESUME" = 1 || { touch "$GETEXEC_CHECKPOINT_DIR/step"; '
+            'exit 1; }; test -e "$GETEXEC_CHECKPOINT_DIR/step" && printf done',
+        ],
+        None,
+        stdout=True,
+        checkpoint=True,
+    )
+    executor = Executor()
+    assert executor.run(spec, "output", str(tmp_path)).returncode == 1
+    assert (checkpoint_dir(spec, str(tmp_path)) / "step").exists()
+    assert executor.run(spec, "output", str(tmp_path)).returncode == 0
+    assert (tmp_path / "output").read_text() == "done"
+    assert not checkpoint_dir(spec, str(tmp_path)).exists()
+
+
+def test_output_is_written_to_scratch_dir(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    scratch = tmp_path / "scratch"
+    monkeypatch.setenv("DATALAD_GETEXEC_SCRATCH__DIR", str(scratch))
+    spec = Spec(
+        ["bash", "-c", 'printf "%s %s" "${1%/*}" "$TMPDIR" > "$1"', "test"], None
+    )
+    result = Executor().run(spec, str(tmp_path / "output"))
+    assert result.returncode == 0
+    directory, tmp = (tmp_path / "output").read_text().split()
+    assert Path(directory).parent == scratch
+    assert tmp == str(Path(directory) / "tmp")
+    assert list(scratch.iterdir()) == []
+
+
+def test_transient_inputs_are_kept_for_overlapping_executions(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    monkeypatch.setenv("DATALAD_GETEXEC_TRANSIENT__INPUTS", "1")
+    raw = tmp_path / "raw.txt"
+    monkeypatch.setattr(
+        execution.inputs, "fetch", lambda paths, cwd: raw.write_text("raw")
+    )
+    monkeypatch.setattr(execution, "drop_inputs", lambda paths, cwd: raw.unlink())
+    executor = Executor()
+    results = {}
+
+    def run(name: str, delay: float) -> None:
+        spec = Spec(
+            ["bash", "-c", 'sleep {}; cat raw.txt > "$1"'.format(delay), "test"],
+            ["raw.txt"],
+        )
+        results[name] = executor.run(spec, name, str(tmp_path)).returncode
+
+    # the first execution fetches the input and is done with it while the
+    # second one, which found it present, still needs it
+    first = threading.Thread(target=run, args=("first", 0.5))
+    first.start()
+    while not raw.exists():
+        time.sleep(0.01)
+    second = threading.Thread(target=run, args=("second", 1.5))
+    second.start()
+    first.join()
+    second.join()
+    assert results == {"first": 0, "second": 0}
+    assert (tmp_path / "second").read_text() == "raw"
+    assert not raw.exists()
+
+
+def test_limits_are_rejected_for_servers(tmp_path: Path) -> None:
+    spec = Spec(["cat"], None, server=True, timeout=10)
+    with pytest.raises(execution.ExecutionError):
+        Executor().run(spec, "output", str(tmp_path))
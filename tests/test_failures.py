@@ -0,0 +1,16 @@
+from pathlib import Path
+
+from datalad_getexec.failures import FailureCache
+
+
+def test_failure_is_remembered_until_ttl_or_forgotten(tmp_path: Path) -> None:
+    cache = FailureCache(tmp_path)
+    assert cache.get("recipe", 60) is None
+    cache.record("recipe", 3, "Failed to execute cmd", "broken\n")
+    failure = cache.get("recipe", 60)
+    assert failure is not None
+    assert failure["returncode"] == 3
+    assert failure["stderr_tail"] == "broken\n"
+    assert cache.get("recipe", -1) is None
+    cache.forget("recipe")
+    assert cache.get("recipe", 60) is None
@@ -0,0 +1,22 @@
+import pytest
+
+from datalad_getexec.gc import Candidate, parse_size, rank, select
+
+
+def test_parse_size() -> None:
+    assert parse_size("512") == 512
+    assert parse_size("10K") == 10 * 1024
+    assert parse_size("1.5GiB") == 3 * 2**29
+    with pytest.raises(ValueError):
+        parse_size("much")
+
+
+def test_rank_prefers_cheap_and_old_files() -> None:
+    day = 86400.0
+    expensive = Candidate("expensive", 100, 100.0, 10 * day, True)
+    cheap = Candidate("cheap", 100, 1.0, 10 * day, True)
+    stale = Candidate("stale", 100, 100.0, 0.0, True)
+    unknown = Candidate("unknown", 100, None, 0.0, True)
+    ranked = rank([unknown, expensive, stale, cheap], now=10 * day)
+    assert [c.path for c in ranked] == ["cheap", "stale", "expensive", "unknown"]
+    assert [c.path for c in select(ranked, 150)] == ["cheap", "stale"]
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+import subprocess
 import tempfile
+import threading
+import time
 from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
@@ -15,6 +18,8 @@ import hypothesis.strategies as hs
 import pytest
 
 import datalad_getexec.remote
+from datalad_getexec.execution import drop_inputs
+from datalad_getexec.spec import Spec
 
 
 @pytest.fixture()
@@ -221,3 +226,384 @@ class DatasetActions(hst.RuleBasedStateMachine):
 
 
 TestDatasetActions = DatasetActions.TestCase
+
+
+def test_get_through_spool_worker(dataset: ddd.Dataset, tmp_path: Path) -> None:
+    dataset.getexec(
+        ["bash", "-c", 'printf "spooled" > "$1"', "test"],
+        path="test.txt",
+    )
+    dataset.drop("test.txt")
+    dataset.config.set(
+        "datalad.getexec.spool-dir", str(tmp_path / "spool"), scope="local"
+    )
+    worker = threading.Thread(
+        target=da.getexec_worker,
+        kwargs=dict(spool=str(tmp_path / "spool"), idle_timeout=5, poll_interval=0.1),
+    )
+    worker.start()
+    dataset.get("test.txt")
+    worker.join()
+    assert (dataset.pathobj / "test.txt").read_text() == "spooled"
+
+
+def test_limits_are_rejected_for_python_callables(dataset: ddd.Dataset) -> None:
+    (result,) = dataset.getexec(
+        ["content"],
+        path="test.txt",
+        python="recipes:write",
+        timeout=10,
+        on_failure="ignore",
+        result_renderer="disabled",
+    )
+    assert result["status"] == "impossible"
+    assert not (dataset.pathobj / "test.txt").exists()
+
+
+def test_getexec_python_callable(dataset: ddd.Dataset) -> None:
+    (dataset.pathobj / "recipes.py").write_text(
+        "def write(content, target):\n"
+        "    with open(target, 'w') as f:\n"
+        "        f.write(content)\n"
+    )
+    dataset.save("recipes.py", to_git=True)
+    dataset.getexec(["from python"], path="test.txt", python="recipes:write")
+    assert (dataset.pathobj / "test.txt").read_text() == "from python"
+    dataset.drop("test.txt")
+    dataset.get("test.txt")
+    assert (dataset.pathobj / "test.txt").read_text() == "from python"
+
+
+def test_getexec_server(dataset: ddd.Dataset) -> None:
+    server = Path(__file__).parent / "resources/line_server.py"
+    dataset.getexec([str(server)], path="a.txt", server=True, args=["a"])
+    dataset.getexec([str(server)], path="b.txt", server=True, args=["b"])
+    dataset.drop(["a.txt", "b.txt"])
+    dataset.get(["a.txt", "b.txt"])
+    assert (dataset.pathobj / "a.txt").read_text() == "a"
+    assert (dataset.pathobj / "b.txt").read_text() == "b"
+
+
+def test_get_through_daemon(
+    dataset: ddd.Dataset, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    dataset.getexec(
+        ["bash", "-c", 'printf "from daemon" > "$1"', "test"],
+        path="test.txt",
+    )
+    dataset.drop("test.txt")
+    monkeypatch.setenv("DATALAD_GETEXEC_DAEMON", "1")
+    monkeypatch.setenv("DATALAD_GETEXEC_RUNTIME__DIR", str(tmp_path))
+    monkeypatch.setenv("DATALAD_GETEXEC_DAEMON__IDLE__TIMEOUT", "1")
+    dataset.get("test.txt")
+    assert (dataset.pathobj / "test.txt").read_text() == "from daemon"
+    assert (tmp_path / "daemon.lock").exists()
+
+
+def test_daemon_executes_inputs_computed_by_itself(
+    dataset: ddd.Dataset, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    dataset.getexec(["bash", "-c", 'printf "raw" > "$1"', "test"], path="raw.txt")
+    dataset.getexec(
+        ["bash", "-c", 'tr a-z A-Z < raw.txt > "$1"', "test"],
+        path="derived.txt",
+        inputs=["raw.txt"],
+    )
+    dataset.drop(["derived.txt", "raw.txt"])
+    monkeypatch.setenv("DATALAD_GETEXEC_DAEMON", "1")
+    monkeypatch.setenv("DATALAD_GETEXEC_DAEMON__JOBS", "1")
+    monkeypatch.setenv("DATALAD_GETEXEC_RUNTIME__DIR", str(tmp_path))
+    monkeypatch.setenv("DATALAD_GETEXEC_DAEMON__IDLE__TIMEOUT", "1")
+    # the daemon fetches raw.txt through a special remote delegating to it
+    subprocess.run(
+        ["datalad", "get", "derived.txt"], cwd=dataset.path, check=True, timeout=120
+    )
+    assert (dataset.pathobj / "derived.txt").read_text() == "RAW"
+
+
+def test_getexec_with_resources(dataset: ddd.Dataset) -> None:
+    dataset.getexec(
+        ["bash", "-c", 'printf "test" > "$1"', "test"],
+        path="test.txt",
+        cpus=1,
+        memory=1,
+        resources=["license=1"],
+        nice=5,
+    )
+    assert (dataset.pathobj / "test.txt").read_text() == "test"
+
+
+def test_exceeding_timeout_raises_error(dataset: ddd.Dataset) -> None:
+    with pytest.raises(datalad.runner.exception.CommandError) as e:
+        dataset.getexec(["bash", "-c", "sleep 30", "test"], path="test.txt", timeout=1)
+    assert "Exceeded timeout limit" in str(e.value)
+
+
+def test_getexec_stdout(dataset: ddd.Dataset) -> None:
+    dataset.getexec(["printf", "from stdout"], path="test.txt", stdout=True)
+    assert (dataset.pathobj / "test.txt").read_text() == "from stdout"
+    dataset.drop("test.txt")
+    dataset.get("test.txt")
+    assert (dataset.pathobj / "test.txt").read_text() == "from stdout"
+
+
+def test_getexec_pipeline(dataset: ddd.Dataset) -> None:
+    dataset.getexec(
+        ["printf", "b\\na\\n", "|", "sort"], path="test.txt", stdout=True, pipeline=True
+    )
+    assert (dataset.pathobj / "test.txt").read_text() == "a\nb\n"
+    dataset.drop("test.txt")
+    dataset.get("test.txt")
+    assert (dataset.pathobj / "test.txt").read_text() == "a\nb\n"
+
+
+def test_getexec_cwd_and_env(dataset: ddd.Dataset) -> None:
+    (dataset.pathobj / "sub").mkdir()
+    dataset.getexec(
+        ["bash", "-c", 'printf "%s" "$GREETING" > "$1"', "test"],
+        path="test.txt",
+        cwd="sub",
+        env=["GREETING=hello"],
+        env_allow=["PATH"],
+    )
+    assert (dataset.pathobj / "test.txt").read_text() == "hello"
+
+
+def test_getexec_multiple_outputs(dataset: ddd.Dataset, tmp_path: Path) -> None:
+    runs = tmp_path / "runs"
+    dataset.getexec(
+        [
+            "bash",
+            "-c",
+            'echo run >> "$0"; printf a > "$1/a.txt"; mkdir "$1/sub"; '
+            'printf b > "$1/sub/b.txt"',
+            str(runs),
+        ],
+        path="parts",
+        outputs=["a.txt", "sub/b.txt"],
+    )
+    assert (dataset.pathobj / "parts" / "a.txt").read_text() == "a"
+    assert (dataset.pathobj / "parts" / "sub" / "b.txt").read_text() == "b"
+    assert runs.read_text() == "run\n"
+    dataset.drop("parts")
+    dataset.get("parts")
+    assert (dataset.pathobj / "parts" / "a.txt").read_text() == "a"
+    assert (dataset.pathobj / "parts" / "sub" / "b.txt").read_text() == "b"
+    assert runs.read_text() == "run\nrun\n"
+
+
+def test_materialize_batches_targets(dataset: ddd.Dataset, tmp_path: Path) -> None:
+    runs = tmp_path / "runs"
+    script = (
+        'echo run >> "$0"; '
+        'while [ $# -gt 0 ]; do printf "%s" "$1" > "$2"; shift 2; done'
+    )
+    for name in ("a", "b", "c"):
+        dataset.getexec(
+            ["bash", "-c", script, str(runs)],
+            path=name + ".txt",
+            args=[name],
+            batch=True,
+        )
+    dataset.drop(["a.txt", "b.txt", "c.txt"])
+    runs.unlink()
+    results = dataset.getexec_materialize(batch_size=2)
+    assert len(results) == 3
+    assert all(r["status"] == "ok" for r in results)
+    for name in ("a", "b", "c"):
+        assert (dataset.pathobj / (name + ".txt")).read_text() == name
+    assert runs.read_text() == "run\nrun\n"
+
+
+def test_getexec_map(dataset: ddd.Dataset) -> None:
+    (dataset.pathobj / "raw").mkdir()
+    for name in ("a", "b"):
+        (dataset.pathobj / "raw" / (name + ".txt")).write_text(name)
+    dataset.save("raw")
+    dataset.getexec(
+        ["bash", "-c", 'tr a-z A-Z < "$1" > "$2"', "test"],
+        path="derived/{stem}.upper",
+        map_glob="raw/*.txt",
+        args=["{path}"],
+    )
+    assert (dataset.pathobj / "derived" / "a.upper").read_text() == "A"
+    assert (dataset.pathobj / "derived" / "b.upper").read_text() == "B"
+    dataset.drop("derived")
+    dataset.get("derived/b.upper")
+    assert (dataset.pathobj / "derived" / "b.upper").read_text() == "B"
+
+
+def test_getexec_parameter_sweep(dataset: ddd.Dataset) -> None:
+    dataset.getexec(
+        ["bash", "-c", 'printf "%s" "$(( $1 * $2 ))" > "$3"', "test"],
+        path="sweep/{a}x{b}.txt",
+        params=["a=2,3", "b=5,7"],
+        args=["{a}", "{b}"],
+        jobs=2,
+    )
+    for a, b in ((2, 5), (2, 7), (3, 5), (3, 7)):
+        path = dataset.pathobj / "sweep" / "{}x{}.txt".format(a, b)
+        assert path.read_text() == str(a * b)
+    assert not dataset.repo.dirty
+
+
+def test_hedged_retrieval_keeps_first_result(
+    dataset: ddd.Dataset, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    dataset.getexec(["printf", "hedged"], path="test.txt", stdout=True)
+    slow = Spec(["bash", "-c", "sleep 30; printf hedged"], None, stdout=True)
+    key = dataset.repo.get_file_annexinfo("test.txt")["key"]
+    dataset.repo.call_annex(["registerurl", key, slow.to_url()])
+    dataset.drop("test.txt")
+    monkeypatch.setenv("DATALAD_GETEXEC_HEDGE", "2")
+    monkeypatch.setenv("DATALAD_GETEXEC_CPUS", "2")
+    start = time.monotonic()
+    dataset.get("test.txt")
+    assert time.monotonic() - start < 20
+    assert (dataset.pathobj / "test.txt").read_text() == "hedged"
+
+
+def test_failing_recipe_fails_fast(
+    dataset: ddd.Dataset, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    flag = tmp_path / "flag"
+    flag.write_text("")
+    dataset.getexec(
+        [
+            "bash",
+            "-c",
+            'test -e "$1" || { echo broken >&2; exit 3; }; printf "test" > "$2"',
+            "test",
+            str(flag),
+        ],
+        path="test.txt",
+    )
+    dataset.drop("test.txt")
+    flag.unlink()
+    (result,) = dataset.get("test.txt", on_failure="ignore", result_renderer="disabled")
+    assert result["status"] == "error"
+    assert "broken" in result["error_message"]
+    flag.write_text("")
+    (result,) = dataset.get("test.txt", on_failure="ignore", result_renderer="disabled")
+    assert result["status"] == "error"
+    assert "Not executing a recipe that failed" in result["error_message"]
+    monkeypatch.setenv("DATALAD_GETEXEC_FORCE", "1")
+    dataset.get("test.txt")
+    assert (dataset.pathobj / "test.txt").read_text() == "test"
+
+
+def test_missing_executable_fails_before_fetching(
+    dataset: ddd.Dataset, tmp_path: Path
+) -> None:
+    script = tmp_path / "script.sh"
+    script.write_text('#!/bin/sh\nprintf "test" > "$1"\n')
+    script.chmod(0o755)
+    dataset.getexec([str(script)], path="test.txt")
+    dataset.drop("test.txt")
+    script.unlink()
+    key = dataset.repo.get_file_annexinfo("test.txt")["key"]
+    assert not dataset.repo.call_annex_success(["checkpresentkey", key, "getexec"])
+    # not known to be lost though, which would be recorded for all clones
+    dataset.repo.call_annex_success(["fsck", "--from", "getexec", "--fast"])
+    (record,) = dataset.repo.call_annex_records(["whereis"], files=["test.txt"])
+    assert datalad_getexec.remote.GETEXEC_REMOTE_UUID in [
+        r["uuid"] for r in record["whereis"]
+    ]
+    (result,) = dataset.get("test.txt", on_failure="ignore", result_renderer="disabled")
+    assert result["status"] == "error"
+    assert "not found" in result["error_message"]
+
+
+def test_output_past_key_size_is_cancelled(
+    dataset: ddd.Dataset, tmp_path: Path
+) -> None:
+    flag = tmp_path / "flag"
+    dataset.getexec(
+        [
+            "bash",
+            "-c",
+            'printf "test"; test -e "$1" || exit 0; printf "more"; sleep 30',
+            "test",
+            str(flag),
+        ],
+        path="test.txt",
+        stdout=True,
+    )
+    dataset.drop("test.txt")
+    flag.write_text("")
+    start = time.monotonic()
+    (result,) = dataset.get("test.txt", on_failure="ignore", result_renderer="disabled")
+    assert result["status"] == "error"
+    assert "exceeded the 4 bytes" in result["error_message"]
+    assert time.monotonic() - start < 20
+
+
+def test_transient_inputs_are_dropped(
+    dataset: ddd.Dataset, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    dataset.getexec(["bash", "-c", 'printf "raw" > "$1"', "test"], path="raw.txt")
+    dataset.getexec(
+        ["bash", "-c", 'tr a-z A-Z < raw.txt > "$1"', "test"],
+        path="derived.txt",
+        inputs=["raw.txt"],
+    )
+    dataset.drop(["derived.txt", "raw.txt"])
+    monkeypatch.setenv("DATALAD_GETEXEC_TRANSIENT__INPUTS", "1")
+    dataset.get("derived.txt")
+    assert (dataset.pathobj / "derived.txt").read_text() == "RAW"
+    assert dataset.repo.file_has_content(["raw.txt", "derived.txt"]) == [False, True]
+
+
+def test_transient_inputs_are_dropped_relative_to_dataset(
+    dataset: ddd.Dataset, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    # as when executing for another process
+    dataset.getexec(["bash", "-c", 'printf "raw" > "$1"', "test"], path="raw.txt")
+    monkeypatch.chdir(tmp_path)
+    drop_inputs(["raw.txt"], cwd=dataset.path)
+    assert dataset.repo.file_has_content(["raw.txt"]) == [False]
+
+
+def test_getexec_input_globs(dataset: ddd.Dataset) -> None:
+    subds = dataset.create("subds")
+    for name in ("a", "b"):
+        subds.getexec(
+            ["bash", "-c", 'printf "%s" "$0" > "$1"', name], path=name + ".txt"
+        )
+    dataset.save()
+    subds.drop(["a.txt", "b.txt"])
+    dataset.getexec(
+        ["bash", "-c", 'cat subds/*.txt > "$1"', "test"],
+        path="joined.txt",
+        input_globs=["subds/*.txt"],
+    )
+    assert (dataset.pathobj / "joined.txt").read_text() == "ab"
+    (record,) = dataset.repo.call_annex_records(["whereis"], files=["joined.txt"])
+    (url,) = [
+        url
+        for remote in record["whereis"]
+        for url in remote["urls"]
+        if url.startswith("getexec:")
+    ]
+    spec = Spec.from_url(url)
+    assert spec.inputs == [] and spec.input_globs == ["subds/*.txt"]
+
+
+def test_gc_drops_recomputable_files(dataset: ddd.Dataset, tmp_path: Path) -> None:
+    script = tmp_path / "script.sh"
+    script.write_text('#!/bin/sh\nprintf "orphan" > "$1"\n')
+    script.chmod(0o755)
+    dataset.getexec(["bash", "-c", 'printf "test" > "$1"', "test"], path="test.txt")
+    dataset.getexec([str(script)], path="orphan.txt")
+    script.unlink()
+    results = dataset.getexec_gc(
+        max_size="0", on_failure="ignore", result_renderer="disabled"
+    )
+    assert [(r["action"], r["status"]) for r in results] == [
+        ("drop", "ok"),
+        ("getexec-gc", "impossible"),
+    ]
+    assert dataset.repo.file_has_content(["test.txt", "orphan.txt"]) == [False, True]
+    dataset.get("test.txt")
+    (result,) = dataset.getexec_gc(max_size="1K", result_renderer="disabled")
+    assert result["status"] == "notneeded"
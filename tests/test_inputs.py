@@ -0,0 +1,28 @@
+import subprocess
+from pathlib import Path
+
+from datalad_getexec.inputs import by_dataset, resolve
+from datalad_getexec.spec import Spec
+
+
+def test_resolve_expands_globs(tmp_path: Path) -> None:
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    for name in ("a.txt", "b.txt", "c.csv", "sub/d.txt"):
+        (tmp_path / name).parent.mkdir(exist_ok=True)
+        (tmp_path / name).write_text("")
+    subprocess.run(["git", "add", "."], cwd=tmp_path, check=True)
+    spec = Spec(["cmd"], ["c.csv", "a.txt"], input_globs=["**/*.txt"])
+    assert resolve(spec, str(tmp_path)) == ["c.csv", "a.txt", "b.txt", "sub/d.txt"]
+
+
+def test_by_dataset_groups_by_closest_dataset(tmp_path: Path) -> None:
+    (tmp_path / "sub" / "nested" / ".git").mkdir(parents=True)
+    (tmp_path / "sub" / "uninstalled").mkdir()
+    groups = by_dataset(
+        ["a", "dir/b", "sub/nested/c", "sub/nested/dir/d", "sub/uninstalled/e"],
+        str(tmp_path),
+    )
+    assert groups == {
+        "": ["a", "dir/b", "sub/uninstalled/e"],
+        "sub/nested": ["sub/nested/c", "sub/nested/dir/d"],
+    }
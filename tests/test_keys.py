@@ -0,0 +1,47 @@
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from datalad_getexec.keys import Key, OutputWatcher, verify
+
+
+def test_parse_key() -> None:
+    key = Key.parse("SHA256E-s5-m1700000000--abc.tar.gz")
+    assert key == Key("SHA256E", 5, "abc.tar.gz")
+    assert key.digest == "abc"
+    with pytest.raises(ValueError):
+        Key.parse("not a key")
+
+
+def test_verify(tmp_path: Path) -> None:
+    path = tmp_path / "file"
+    path.write_bytes(b"hello")
+    digest = hashlib.sha256(b"hello").hexdigest()
+    assert verify("SHA256E-s5--{}.txt".format(digest), str(path))
+    assert not verify("SHA256E-s6--{}.txt".format(digest), str(path))
+    assert not verify("SHA256-s5--{}".format("0" * 64), str(path))
+    # nothing to check for backends not based on a hash
+    assert verify("WORM-s5-m1--file", str(path))
+
+
+def test_output_watcher_follows_appended_output(tmp_path: Path) -> None:
+    path = tmp_path / "file"
+    digest = hashlib.sha256(b"hello").hexdigest()
+    watcher = OutputWatcher("SHA256E-s5--{}.txt".format(digest), str(path), 0.01)
+    watcher.start()
+    with open(path, "wb") as f:
+        f.write(b"hel")
+        f.flush()
+        f.write(b"lo")
+    assert watcher.finish() is True
+    assert not watcher.cancel.is_set()
+
+
+def test_output_watcher_cancels_output_past_size(tmp_path: Path) -> None:
+    path = tmp_path / "file"
+    watcher = OutputWatcher("SHA256E-s5--{}.txt".format("0" * 64), str(path), 0.01)
+    watcher.start()
+    path.write_bytes(b"hello world")
+    assert watcher.cancel.wait(5)
+    assert watcher.finish() is False
@@ -0,0 +1,36 @@
+import sys
+import time
+
+from datalad_getexec.execution import run_cmd
+from datalad_getexec.limits import Limits
+
+
+def test_timeout_kills_command() -> None:
+    start = time.monotonic()
+    result = run_cmd(["sleep", "30"], limits=Limits(timeout=1))
+    assert time.monotonic() - start < 10
+    assert result.returncode != 0
+    assert result.limit_exceeded == "timeout"
+
+
+def test_cpu_time_limit_kills_command() -> None:
+    result = run_cmd(
+        [sys.executable, "-c", "while True: pass"], limits=Limits(cpu_time=1)
+    )
+    assert result.returncode != 0
+    assert result.limit_exceeded == "cpu_time"
+
+
+def test_memory_limit_kills_command() -> None:
+    result = run_cmd(
+        [sys.executable, "-c", "import time; x = bytearray(2**29); time.sleep(30)"],
+        limits=Limits(memory=64),
+    )
+    assert result.returncode != 0
+    assert result.limit_exceeded == "memory"
+
+
+def test_command_within_limits_succeeds() -> None:
+    result = run_cmd(["true"], limits=Limits(timeout=10, cpu_time=10, memory=1024))
+    assert result.returncode == 0
+    assert result.limit_exceeded is None
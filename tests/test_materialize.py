@@ -0,0 +1,11 @@
+from datalad_getexec.materialize import batch_id, batch_spec
+from datalad_getexec.spec import Spec
+
+
+def test_batch_spec_passes_args_and_target_of_each() -> None:
+    a = Spec(["cmd"], ["in-a"], args=["a"], batch=True)
+    b = Spec(["cmd"], ["in-b"], args=["b"], batch=True)
+    assert batch_id(a) == batch_id(b)
+    spec, target = batch_spec([(a, "out-a"), (b, "out-b")])
+    assert spec.command(target) == ["cmd", "a", "out-a", "b", "out-b"]
+    assert spec.inputs == ["in-a", "in-b"]
@@ -0,0 +1,23 @@
+from pathlib import Path
+
+from datalad_getexec.metrics import DEFAULT_FETCH_COST, MetricsStore, estimate
+from datalad_getexec.spec import Spec
+
+
+def test_record_run_keeps_mean_duration(tmp_path: Path) -> None:
+    store = MetricsStore(tmp_path)
+    store.record_run("recipe", 1.0)
+    store.record_run("recipe", 3.0)
+    assert store.load()["recipes"]["recipe"] == {"runs": 2, "duration": 2.0}
+
+
+def test_estimate_adds_cost_of_missing_inputs(tmp_path: Path) -> None:
+    (tmp_path / "present").write_text("")
+    store = MetricsStore(tmp_path)
+    spec = Spec(["cmd"], ["present", "fetched", "unknown"])
+    store.record_run(spec.fingerprint(), 1.0)
+    store.record_fetch(["fetched"], 4.0)
+    cost, reason = estimate(spec, store.load(), str(tmp_path))
+    assert cost == 1.0 + 4.0 + DEFAULT_FETCH_COST
+    assert "2 of 3 inputs missing" in reason
+    assert estimate(Spec(["other"], None), store.load())[0] is None
@@ -0,0 +1,94 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from datalad_getexec.pool import PythonWorkerPool
+
+RECIPES = """\
+import os
+
+
+def write(content, target):
+    with open(target, "w") as f:
+        f.write(content)
+
+
+def pid(target):
+    with open(target, "w") as f:
+        f.write(str(os.getpid()))
+
+
+def chatty(target):
+    print("some progress")
+    with open(target, "w") as f:
+        f.write("done")
+
+
+def fail(target):
+    raise RuntimeError("failing on purpose")
+"""
+
+
+def test_pool_calls_function_relative_to_cwd(tmp_path: Path) -> None:
+    (tmp_path / "recipes.py").write_text(RECIPES)
+    pool = PythonWorkerPool(preload=[], cwd=str(tmp_path), max_workers=1)
+    try:
+        result = pool.run("recipes:write", ["content", "out.txt"])
+        assert result.returncode == 0
+        assert (tmp_path / "out.txt").read_text() == "content"
+        result = pool.run("recipes:fail", ["out.txt"])
+        assert result.returncode != 0
+    finally:
+        pool.close()
+
+
+def test_pool_reuses_workers(tmp_path: Path) -> None:
+    (tmp_path / "recipes.py").write_text(RECIPES)
+    pool = PythonWorkerPool(preload=[], cwd=str(tmp_path), max_workers=1)
+    try:
+        pool.run("recipes:pid", ["first"])
+        pool.run("recipes:pid", ["second"])
+    finally:
+        pool.close()
+    assert (tmp_path / "first").read_text() == (tmp_path / "second").read_text()
+
+
+def test_pool_keeps_stdout_clean(tmp_path: Path) -> None:
+    # stdout of the special remote is the channel to git-annex
+    (tmp_path / "recipes.py").write_text(RECIPES)
+    script = (
+        "from datalad_getexec.pool import PythonWorkerPool\n"
+        "pool = PythonWorkerPool(preload=[], cwd={!r}, max_workers=1)\n"
+        "assert pool.run('recipes:chatty', ['out.txt']).returncode == 0\n"
+        "pool.close()\n"
+    ).format(str(tmp_path))
+    process = subprocess.run(
+        [sys.executable, "-c", script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    assert process.stdout == ""
+    assert "some progress" in process.stderr
+    assert (tmp_path / "out.txt").read_text() == "done"
+
+
+def test_pool_imports_relative_to_its_cwd(tmp_path: Path) -> None:
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "recipes.py").write_text(
+            RECIPES.replace("f.write(content)", 'f.write("{}")'.format(name))
+        )
+    pools = [
+        PythonWorkerPool(preload=[], cwd=str(tmp_path / name), max_workers=1)
+        for name in ("a", "b")
+    ]
+    try:
+        for pool in pools:
+            assert pool.run("recipes:write", ["", "out.txt"]).returncode == 0
+    finally:
+        for pool in pools:
+            pool.close()
+    assert (tmp_path / "a" / "out.txt").read_text() == "a"
+    assert (tmp_path / "b" / "out.txt").read_text() == "b"
@@ -0,0 +1,35 @@
+from pathlib import Path
+
+from datalad_getexec.preflight import Preflight
+from datalad_getexec.spec import Spec
+
+
+def test_preflight_finds_executables(tmp_path: Path) -> None:
+    (tmp_path / "script.sh").write_text("")
+    preflight = Preflight(str(tmp_path))
+    assert preflight.check(Spec(["true"], None)) is None
+    assert preflight.check(Spec(["./script.sh"], None)) is None
+    assert preflight.check(Spec(["true"], None, pipeline=[["no-such-command"]])) == (
+        "executable no-such-command not found"
+    )
+    # executing without a PATH looks in the default one
+    assert preflight.check(Spec(["true"], None, env_allow=[])) is None
+    assert preflight.check(Spec(["true"], None, env={"PATH": str(tmp_path)})) == (
+        "executable true not found"
+    )
+    assert (
+        Preflight(str(tmp_path), executables=False).check(
+            Spec(["no-such-command"], None)
+        )
+        is None
+    )
+
+
+def test_preflight_finds_python_modules(tmp_path: Path) -> None:
+    (tmp_path / "local.py").write_text("")
+    preflight = Preflight(str(tmp_path))
+    assert preflight.check(Spec([], None, python="json:dumps")) is None
+    assert preflight.check(Spec([], None, python="local:f")) is None
+    assert preflight.check(Spec([], None, python="no_such_module:f")) == (
+        "python module of no_such_module:f not found"
+    )
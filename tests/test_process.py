@@ -0,0 +1,55 @@
+import signal
+import subprocess
+import sys
+import time
+
+from datalad_getexec import process
+from datalad_getexec.execution import run_cmd
+
+
+def test_leftover_processes_are_terminated() -> None:
+    start = time.monotonic()
+    result = run_cmd(["bash", "-c", "sleep 60 & sleep 60 & echo started"])
+    assert result.returncode == 0
+    assert time.monotonic() - start < 30
+
+
+def test_terminate_group_escalates_to_sigkill() -> None:
+    proc = subprocess.Popen(
+        ["bash", "-c", "trap '' TERM; sleep 60 & wait"], start_new_session=True
+    )
+    time.sleep(0.2)
+    process.terminate_group(proc.pid, grace=0.5)
+    proc.wait(timeout=5)
+    assert not process.group_alive(proc.pid)
+
+
+def test_terminate_group_does_not_wait_for_zombies() -> None:
+    # nobody reaps the child until terminate_group returns
+    proc = subprocess.Popen(["sleep", "60"], start_new_session=True)
+    start = time.monotonic()
+    process.terminate_group(proc.pid, grace=30)
+    assert time.monotonic() - start < 10
+    assert proc.wait(timeout=5) == -signal.SIGTERM
+
+
+def test_signal_handler_does_not_deadlock_on_registry_lock() -> None:
+    # the main thread holds the lock when the signal arrives
+    script = (
+        "import os, signal, subprocess, time\n"
+        "from datalad_getexec import process\n"
+        "child = subprocess.Popen(['sleep', '60'], start_new_session=True)\n"
+        "print(child.pid, flush=True)\n"
+        "process.install_signal_handlers(grace=1)\n"
+        "process.register_group(child.pid)\n"
+        "with process._lock:\n"
+        "    os.kill(os.getpid(), signal.SIGTERM)\n"
+        "    time.sleep(30)\n"
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-c", script], stdout=subprocess.PIPE, text=True
+    )
+    assert proc.stdout is not None
+    child = int(proc.stdout.readline())
+    assert proc.wait(timeout=15) == -signal.SIGTERM
+    assert not process.group_alive(child)
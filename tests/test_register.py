@@ -2,3 +2,21 @@ def test_register() -> None:
     import datalad.api as da
 
     assert hasattr(da, "getexec")
+
+
+def test_register_worker() -> None:
+    import datalad.api as da
+
+    assert hasattr(da, "getexec_worker")
+
+
+def test_register_materialize() -> None:
+    import datalad.api as da
+
+    assert hasattr(da, "getexec_materialize")
+
+
+def test_register_gc() -> None:
+    import datalad.api as da
+
+    assert hasattr(da, "getexec_gc")
@@ -0,0 +1,41 @@
+import json
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+from datalad_getexec.resources import ResourcePool
+
+
+def test_acquire_waits_for_capacity(tmp_path: Path) -> None:
+    pool = ResourcePool(tmp_path)
+    events: List[str] = []
+
+    def execute(name: str) -> None:
+        with pool.acquire({"cpus": 2}, {"cpus": 3}, poll_interval=0.01):
+            events.append(name + " start")
+            time.sleep(0.2)
+            events.append(name + " end")
+
+    threads = [threading.Thread(target=execute, args=(n,)) for n in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert events[1].endswith("end")
+
+
+def test_oversized_need_runs_alone(tmp_path: Path) -> None:
+    pool = ResourcePool(tmp_path)
+    with pool.acquire({"cpus": 16}, {"cpus": 4}):
+        pass
+
+
+def test_allocations_of_dead_processes_are_discarded(tmp_path: Path) -> None:
+    # pids on Linux are at most 2**22, so this one can not exist
+    state = {"dead": {"pid": 2**22 + 1, "needs": {"cpus": 4}}}
+    (tmp_path / "resources.json").write_text(json.dumps(state))
+    pool = ResourcePool(tmp_path)
+    with pool.acquire({"cpus": 4}, {"cpus": 4}):
+        allocations = json.loads((tmp_path / "resources.json").read_text())
+        assert "dead" not in allocations
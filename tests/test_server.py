@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+
+from datalad_getexec.server import ServerPool
+
+LINE_SERVER = [sys.executable, str(Path(__file__).parent / "resources/line_server.py")]
+
+
+def test_server_is_reused_between_requests(tmp_path: Path) -> None:
+    pool = ServerPool()
+    try:
+        assert pool.request(LINE_SERVER, ["a"], str(tmp_path / "a")).returncode == 0
+        assert pool.request(LINE_SERVER, ["pid"], str(tmp_path / "b")).returncode == 0
+        assert pool.request(LINE_SERVER, ["pid"], str(tmp_path / "c")).returncode == 0
+        assert pool.request(LINE_SERVER, ["fail"], str(tmp_path / "d")).returncode != 0
+    finally:
+        pool.close()
+    assert (tmp_path / "a").read_text() == "a"
+    assert (tmp_path / "b").read_text() == (tmp_path / "c").read_text()
+
+
+def test_server_is_recycled_after_max_jobs(tmp_path: Path) -> None:
+    pool = ServerPool(max_jobs=1)
+    try:
+        pool.request(LINE_SERVER, ["pid"], str(tmp_path / "a"))
+        pool.request(LINE_SERVER, ["pid"], str(tmp_path / "b"))
+    finally:
+        pool.close()
+    assert (tmp_path / "a").read_text() != (tmp_path / "b").read_text()
@@ -0,0 +1,72 @@
+import errno
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from datalad_getexec.singleflight import flight_id, single_flight
+
+
+@pytest.mark.parametrize("link", [True, False], ids=["link", "copy"])
+def test_concurrent_callers_execute_once(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, link: bool
+) -> None:
+    if not link:
+
+        def no_link(source: str, target: str) -> None:
+            raise OSError(errno.EPERM, "no hard links here")
+
+        monkeypatch.setattr(os, "link", no_link)
+    id = flight_id("fingerprint", "key")
+    executions: List[str] = []
+    started = threading.Event()
+
+    def retrieve(name: str) -> None:
+        with single_flight(tmp_path / "sf", id, str(tmp_path / name)) as execute:
+            if execute:
+                started.set()
+                executions.append(name)
+                time.sleep(0.5)
+                (tmp_path / name).write_text("output")
+
+    first = threading.Thread(target=retrieve, args=("a",))
+    first.start()
+    started.wait()
+    second = threading.Thread(target=retrieve, args=("b",))
+    second.start()
+    first.join()
+    second.join()
+    assert executions == ["a"]
+    assert (tmp_path / "b").read_text() == "output"
+    assert list((tmp_path / "sf").iterdir()) == []
+    assert not (tmp_path / "a.singleflight").exists()
+
+
+def test_output_is_not_published_without_waiters(tmp_path: Path) -> None:
+    id = flight_id("fingerprint", "key")
+    for name in ("a", "b"):
+        with single_flight(tmp_path / "sf", id, str(tmp_path / name)) as execute:
+            assert execute
+            (tmp_path / name).write_text("output")
+    assert not (tmp_path / "a.singleflight").exists()
+
+
+def test_leftovers_of_dead_waiters_are_removed(tmp_path: Path) -> None:
+    directory = tmp_path / "sf"
+    directory.mkdir()
+    dead = subprocess.Popen(["true"])
+    dead.wait()
+    id = flight_id("fingerprint", "other key")
+    (directory / (id + ".lock")).touch()
+    (directory / "{}.wait.{}.1".format(id, dead.pid)).touch()
+    link = tmp_path / "a.singleflight"
+    link.write_text("output")
+    (directory / (id + ".out")).write_text(str(link))
+    with single_flight(directory, flight_id("fingerprint", "key"), "b") as execute:
+        assert execute
+    assert list(directory.iterdir()) == []
+    assert not link.exists()
@@ -0,0 +1,98 @@
+import json
+import socket
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from datalad_getexec import spool
+
+
+def _job(tmp_path: Path) -> spool.Job:
+    return spool.Job(
+        url="getexec:v1-abc",
+        key="MD5E-s0--d41d8cd98f00b204e9800998ecf8427e",
+        filename=str(tmp_path / "target"),
+        cwd=str(tmp_path),
+    )
+
+
+def test_job_is_claimed_only_once(tmp_path: Path) -> None:
+    job = _job(tmp_path)
+    spool.submit(tmp_path / "spool", job)
+    assert list(spool.claim(tmp_path / "spool")) == [job]
+    assert list(spool.claim(tmp_path / "spool")) == []
+
+
+def test_wait_returns_result_of_finished_job(tmp_path: Path) -> None:
+    job = _job(tmp_path)
+    spool.submit(tmp_path / "spool", job)
+
+    def work() -> None:
+        for claimed in spool.claim(tmp_path / "spool"):
+            spool.finish(tmp_path / "spool", claimed, {"returncode": 0})
+
+    worker = threading.Thread(target=work)
+    worker.start()
+    result = spool.wait(tmp_path / "spool", job, timeout=10, poll_interval=0.01)
+    worker.join()
+    assert result == {"returncode": 0}
+    assert not any((tmp_path / "spool" / "claimed").iterdir())
+    assert not any((tmp_path / "spool" / "done").iterdir())
+
+
+def test_wait_times_out_and_withdraws_job(tmp_path: Path) -> None:
+    job = _job(tmp_path)
+    spool.submit(tmp_path / "spool", job)
+    with pytest.raises(spool.SpoolTimeoutError):
+        spool.wait(tmp_path / "spool", job, timeout=0, poll_interval=0.01)
+    assert list(spool.claim(tmp_path / "spool")) == []
+
+
+def test_jobs_of_dead_workers_are_requeued(tmp_path: Path) -> None:
+    job = _job(tmp_path)
+    spool.submit(tmp_path / "spool", job)
+    assert list(spool.claim(tmp_path / "spool")) == [job]
+    # still leased to us
+    assert list(spool.claim(tmp_path / "spool")) == []
+    dead = subprocess.Popen(["true"])
+    dead.wait()
+    worker = tmp_path / "spool" / "claimed" / (job.id + ".worker")
+    worker.write_text(json.dumps({"host": socket.gethostname(), "pid": dead.pid}))
+    assert list(spool.claim(tmp_path / "spool")) == [job]
+
+
+def test_expired_leases_are_requeued_unless_renewed(tmp_path: Path) -> None:
+    job = _job(tmp_path)
+    spool.submit(tmp_path / "spool", job)
+    assert list(spool.claim(tmp_path / "spool", lease=0.3)) == [job]
+    with spool.leased(tmp_path / "spool", job, lease=0.3):
+        time.sleep(0.6)
+        assert list(spool.claim(tmp_path / "spool", lease=0.3)) == []
+    time.sleep(0.4)
+    assert list(spool.claim(tmp_path / "spool", lease=0.3)) == [job]
+
+
+def test_jobs_carry_only_allowed_variables(tmp_path: Path) -> None:
+    env = spool.job_env(
+        {
+            "PATH": "/bin",
+            "DATALAD_GETEXEC_SPOOL__DIR": "/spool",
+            "SECRET_TOKEN": "secret",
+            "TMPDIR": "/tmp/submitter",
+            "MY_VAR": "mine",
+        },
+        ["MY_*"],
+    )
+    assert env == {
+        "PATH": "/bin",
+        "DATALAD_GETEXEC_SPOOL__DIR": "/spool",
+        "MY_VAR": "mine",
+    }
+    job = _job(tmp_path)
+    job.env = env
+    spool.submit(tmp_path / "spool", job)
+    (path,) = (tmp_path / "spool" / "new").iterdir()
+    assert path.stat().st_mode & 0o777 == 0o600
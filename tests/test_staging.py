@@ -0,0 +1,73 @@
+import os
+import subprocess
+import threading
+from pathlib import Path
+
+from datalad_getexec import staging
+from datalad_getexec.spec import Spec
+
+
+def test_outputs_share_recipe_id() -> None:
+    spec = Spec(["cmd"], None, outputs=["a", "b"])
+    a = Spec(["cmd"], None, outputs=["a", "b"], output="a")
+    b = Spec(["cmd"], None, outputs=["a", "b"], output="b")
+    assert staging.recipe_id(a) == staging.recipe_id(b) == spec.fingerprint()
+
+
+def test_take_removes_emptied_directories(tmp_path: Path) -> None:
+    with staging.locked(tmp_path / "staged", "id") as staged:
+        (staged / "sub").mkdir(parents=True)
+        (staged / "sub" / "a").write_text("a")
+        (staged / "b").write_text("b")
+        assert staging.take(staged, "sub/a", str(tmp_path / "a"))
+        assert not (staged / "sub").exists()
+        assert not staging.take(staged, "sub/a", str(tmp_path / "a"))
+        assert staging.take(staged, "b", str(tmp_path / "b"))
+        assert not staged.exists()
+    assert (tmp_path / "a").read_text() == "a"
+
+
+def test_stage_id_depends_on_inputs(tmp_path: Path) -> None:
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    spec = Spec(["cmd"], ["input"], outputs=["a", "b"], output="a")
+    (tmp_path / "input").write_text("1")
+    subprocess.run(["git", "add", "input"], cwd=tmp_path, check=True)
+    first = staging.stage_id(spec, str(tmp_path))
+    assert staging.stage_id(spec, str(tmp_path)) == first
+    (tmp_path / "input").write_text("2")
+    subprocess.run(["git", "add", "input"], cwd=tmp_path, check=True)
+    assert staging.stage_id(spec, str(tmp_path)) != first
+
+
+def test_expire_keeps_recent_and_locked_outputs(tmp_path: Path) -> None:
+    directory = tmp_path / "staged"
+    for id in ("old", "recent", "busy"):
+        with staging.locked(directory, id) as staged:
+            staged.mkdir()
+            (staged / "a").write_text("a")
+    for id in ("old", "busy"):
+        os.utime(directory / id, (0, 0))
+    in_use = threading.Event()
+    done = threading.Event()
+
+    def use() -> None:
+        with staging.locked(directory, "busy"):
+            in_use.set()
+            done.wait()
+
+    user = threading.Thread(target=use)
+    user.start()
+    in_use.wait()
+    try:
+        assert staging.expire(directory, 3600) == 1
+    finally:
+        done.set()
+        user.join()
+    assert sorted(p.name for p in directory.iterdir()) == [
+        "busy",
+        "busy.lock",
+        "recent",
+        "recent.lock",
+    ]
+    assert staging.expire(directory, 0) == 2
+    assert list(directory.iterdir()) == []
@@ -0,0 +1,18 @@
+from pathlib import Path
+from typing import List
+
+from datalad_getexec.transient import TransientInputs
+
+
+def test_last_reference_drops_input(tmp_path: Path) -> None:
+    dropped: List[List[str]] = []
+    inputs = TransientInputs(tmp_path)
+    first = inputs.acquire(["raw", "present"], missing=["raw"])
+    assert first == ["raw"]
+    # fetched by the first execution, so held by the second as well
+    second = inputs.acquire(["raw", "present"], missing=[])
+    assert second == ["raw"]
+    inputs.release(first, dropped.append)
+    assert dropped == []
+    inputs.release(second, dropped.append)
+    assert dropped == [["raw"]]
@@ -0,0 +1,39 @@
+import os
+import signal
+import subprocess
+import time
+from pathlib import Path
+
+from datalad_getexec import process, spool
+from datalad_getexec.spec import Spec
+
+
+def test_worker_terminates_command_on_signal(tmp_path: Path) -> None:
+    spec = Spec(
+        ["bash", "-c", 'echo $$ > pid; printf partial > "$1"; sleep 60', "test"], None
+    )
+    job = spool.Job(
+        url=spec.to_url(),
+        key="MD5E-s0--d41d8cd98f00b204e9800998ecf8427e",
+        filename=str(tmp_path / "output"),
+        cwd=str(tmp_path),
+    )
+    spool.submit(tmp_path / "spool", job)
+    worker = subprocess.Popen(
+        ["datalad", "getexec-worker", "--spool", str(tmp_path / "spool")],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while not (tmp_path / "output").exists():
+            assert time.monotonic() < deadline
+            time.sleep(0.1)
+        pgid = int((tmp_path / "pid").read_text())
+        os.kill(worker.pid, signal.SIGTERM)
+        assert worker.wait(timeout=30) == -signal.SIGTERM
+    finally:
+        worker.kill()
+        worker.wait()
+    assert not process.group_alive(pgid)
+    assert not (tmp_path / "output").exists()